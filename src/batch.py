@@ -0,0 +1,231 @@
+'''
+The batch.py module implements a headless solver that scans directories
+of puzzle images across a pool of processes and prints one JSON result
+per image
+'''
+
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import cache
+import imaging
+import ocr
+import search
+import tracing
+
+_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+# word lists loaded by this process, so each worker reads a dictionary only once
+_dictionaries = dict()
+
+
+def load_dictionary(path: str) -> search.WordTrie:
+    '''
+    Returns the trie of a word list file, loading it on first use
+    '''
+    if path not in _dictionaries:
+        _dictionaries[path] = search.WordTrie.from_file(path)
+    return _dictionaries[path]
+
+
+def parse_region(spec: str) -> (float, float, float, float):
+    '''
+    Parses a region given as "x1,y1,x2,y2", either in pixels or
+    as fractions of the image size when every value is at most 1
+    '''
+    values = tuple(float(value) for value in spec.split(','))
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError(f'Region must be x1,y1,x2,y2, got {spec!r}')
+    return values
+
+
+def _resolve_region(region, width, height) -> ((int, int), (int, int)):
+    '''
+    Converts a parsed region into the pixel coordinates of its two corners
+    '''
+    x1, y1, x2, y2 = region
+    if all(value <= 1 for value in region):
+        x1, x2 = x1 * width, x2 * width
+        y1, y2 = y1 * height, y2 * height
+    return (round(x1), round(y1)), (round(x2), round(y2))
+
+
+def find_images(paths: [str]) -> [str]:
+    '''
+    Expands the given directories, globs and files into a sorted list of image paths
+    '''
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = [os.path.join(path, name) for name in os.listdir(path)]
+        else:
+            candidates = glob.glob(path) or [path]
+        images.extend(candidate for candidate in candidates
+                      if os.path.isfile(candidate) and candidate.lower().endswith(_IMAGE_EXTENSIONS))
+    return sorted(set(images))
+
+
+def solve_image(path: str, wordsearch_region, wordbank_region, use_cache=True, preprocessor=None,
+                max_mismatches=0, dictionary=None, min_length=4, auto=False) -> dict:
+    '''
+    Scans the word search and word bank regions of an image and solves
+    the puzzle, returning a JSON serializable result. Words that are not
+    found are matched again allowing up to max_mismatches misread letters.
+    If the path of a word list is given as dictionary, every word of it
+    with at least min_length letters that is hidden in the grid is also
+    listed, and the word bank region may be None. In auto mode, regions
+    that are None are detected in the image
+    '''
+    ocr_cache = cache.get_default_cache() if use_cache else None
+    tracing.count('images')
+    try:
+        image = imaging.Imaging(path)
+        width, height = image.get_image_dimensions()
+        wordsearch_corners, wordbank_corners = (None if region is None else _resolve_region(region, width, height)
+                                                for region in (wordsearch_region, wordbank_region))
+        if auto and (wordsearch_corners is None or wordbank_corners is None):
+            detected = [None if box is None else (box[:2], box[2:]) for box in image.detect_regions()]
+            wordsearch_corners = wordsearch_corners or detected[0]
+            wordbank_corners = wordbank_corners or detected[1]
+        if wordsearch_corners is None:
+            raise ValueError('No word search region was given or detected')
+        wordsearch_results = image.process_selection(
+            *wordsearch_corners, config=imaging.WORDSEARCH_CONFIG, cache=ocr_cache, preprocessor=preprocessor)
+        wordbank_results = []
+        if wordbank_corners is not None:
+            wordbank_results = image.process_selection(
+                *wordbank_corners, config=imaging.WORDBANK_CONFIG, cache=ocr_cache, preprocessor=preprocessor)
+
+        grid = search.build_grid([result.char for result in wordsearch_results])
+        words = [result.char.upper() for result in wordbank_results]
+        searcher = search.Searcher(grid)
+        discovered = searcher.discover(load_dictionary(dictionary), min_length) if dictionary else None
+        answers = searcher.search_all(words)
+        approximate = dict()
+        if max_mismatches > 0:
+            confidence = [[result.conf] * len(row) for result, row in zip(wordsearch_results, grid)]
+            approximate = searcher.search_approximate([word for word in words if answers[word] is None],
+                                                      max_mismatches, confidence)
+    except Exception as e:
+        return {'image': path, 'error': str(e)}
+
+    result = {
+        'image': path,
+        'grid': [''.join(row) for row in grid],
+        'words': {word: [fs._asdict() for fs in found] if found else None for word, found in answers.items()}
+    }
+    if max_mismatches > 0:
+        result['approximate'] = {word: [fs._asdict() for fs in found] if found else None
+                                 for word, found in approximate.items()}
+    if auto:
+        result['regions'] = {'wordsearch': [*wordsearch_corners[0], *wordsearch_corners[1]],
+                             'wordbank': [*wordbank_corners[0], *wordbank_corners[1]] if wordbank_corners else None}
+    if discovered is not None:
+        result['discovered'] = {word: [fs._asdict() for fs in found] for word, found in discovered.items()}
+    return result
+
+
+def run(paths: [str], wordsearch_region, wordbank_region, workers=None, max_jobs=200, use_cache=True,
+        preprocessor=None, max_mismatches=0, dictionary=None, min_length=4, auto=False, server=None,
+        trace=None, out=sys.stdout) -> None:
+    '''
+    Solves every image in the given paths and writes each result as
+    one line of JSON as soon as it is finished. Each worker keeps its
+    OCR backend loaded and is replaced after max_jobs images, and saves
+    its own trace if a trace path with {pid} is given. If the address of
+    a solver service is given, the images are sent to it instead
+    '''
+    images = find_images(paths)
+    if server is not None:
+        import service
+        client = service.SolverClient(server)
+        # the service batches concurrent requests, so several are kept in flight
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = [executor.submit(client.solve_image, path, wordsearch_region, wordbank_region, use_cache,
+                                       max_mismatches, dictionary, min_length, auto)
+                       for path in images]
+            for future in as_completed(futures):
+                print(json.dumps(future.result()), file=out, flush=True)
+        return
+    if workers == 1:
+        for path in images:
+            result = solve_image(path, wordsearch_region, wordbank_region, use_cache, preprocessor, max_mismatches,
+                                 dictionary, min_length, auto)
+            print(json.dumps(result), file=out, flush=True)
+        return
+
+    initializer, initargs = (tracing.enable_worker, (trace,)) if trace else (None, ())
+    with ocr.RecyclingProcessPool(workers, max_jobs, initializer=initializer, initargs=initargs) as executor:
+        # only a couple of images per worker are queued, so a pool being recycled has little left to finish
+        remaining = iter(images)
+        pending = set()
+        while True:
+            for path in remaining:
+                pending.add(executor.submit(solve_image, path, wordsearch_region, wordbank_region, use_cache,
+                                            preprocessor, max_mismatches, dictionary, min_length, auto))
+                if len(pending) >= 2 * executor.get_workers():
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                print(json.dumps(future.result()), file=out, flush=True)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Solve word search images without the user interface.')
+    parser.add_argument('paths', nargs='+', help='image files, directories or glob patterns')
+    parser.add_argument('--wordsearch', type=parse_region, default=None,
+                        help='word search region as x1,y1,x2,y2 in pixels or fractions of the image')
+    parser.add_argument('--wordbank', type=parse_region, default=None,
+                        help='word bank region as x1,y1,x2,y2 in pixels or fractions of the image')
+    parser.add_argument('--auto', action='store_true',
+                        help='detect the word search and word bank regions that are not given')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--max-jobs', type=int, default=200,
+                        help='number of images a worker solves before it is replaced')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='scan every image again instead of reusing cached OCR results')
+    parser.add_argument('--trace',
+                        help='record the time of each stage to this JSON or .trace file, one per worker process')
+    parser.add_argument('--glyph-height', type=int, default=None,
+                        help='rescale scans so their letters are this many pixels tall before OCR')
+    parser.add_argument('--binarize', action='store_true', help='binarize scans before OCR')
+    parser.add_argument('--deskew', action='store_true', help='remove the skew of scans before OCR')
+    parser.add_argument('--max-mismatches', type=int, default=0,
+                        help='match words that are not found allowing this many misread letters')
+    parser.add_argument('--dictionary',
+                        help='word list file, one word per line, to find every listed word hidden in the grid')
+    parser.add_argument('--min-length', type=int, default=4,
+                        help='shortest dictionary word to list (default: 4)')
+    parser.add_argument('--server', help='address of a running solver service to send the images to')
+    args = parser.parse_args(argv)
+    if args.wordsearch is None and not args.auto:
+        parser.error('--wordsearch is required unless regions are detected with --auto')
+    if args.wordbank is None and args.dictionary is None and not args.auto:
+        parser.error('--wordbank is required unless a --dictionary is given or regions are detected with --auto')
+    if args.server and (args.glyph_height or args.binarize or args.deskew):
+        parser.error('preprocessing options cannot be used with --server')
+    trace = None
+    if args.trace:
+        if args.workers == 1 or args.server:
+            tracing.enable(args.trace)
+        else:
+            # every worker process saves its own trace
+            root, extension = os.path.splitext(args.trace)
+            trace = f'{root}.{{pid}}{extension}'
+    preprocessor = None
+    if args.glyph_height or args.binarize or args.deskew:
+        preprocessor = imaging.Preprocessor(glyph_height=args.glyph_height, binarize=args.binarize,
+                                            deskew=args.deskew)
+    run(args.paths, args.wordsearch, args.wordbank, workers=args.workers, max_jobs=args.max_jobs,
+        use_cache=not args.no_cache, preprocessor=preprocessor, max_mismatches=args.max_mismatches,
+        dictionary=args.dictionary, min_length=args.min_length, auto=args.auto, server=args.server, trace=trace)
+
+
+if __name__ == '__main__':
+    main()
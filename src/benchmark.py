@@ -0,0 +1,224 @@
+'''
+The benchmark.py module implements a benchmark harness for the search
+engines and the OCR pipeline, using seeded synthetic puzzles, and saves
+the timings as JSON so runs can be compared
+'''
+
+import argparse
+import glob
+import json
+import platform
+import random
+import re
+import string
+import subprocess
+import sys
+import time
+import search
+import sharded
+
+_LETTERS = string.ascii_uppercase
+
+
+def generate_puzzle(rows: int, cols: int, word_count: int, seed=0, min_length=3, max_length=12) -> ([[str]], [str]):
+    '''
+    Generates a grid of random letters with a word bank of random words,
+    where about half of the words are placed in the grid in a random direction
+    '''
+    rng = random.Random(seed)
+    grid = [rng.choices(_LETTERS, k=cols) for _ in range(rows)]
+    max_length = min(max_length, max(rows, cols))
+    min_length = min(min_length, max_length)
+    words = []
+    for index in range(word_count):
+        word = ''.join(rng.choices(_LETTERS, k=rng.randint(min_length, max_length)))
+        words.append(word)
+        if index % 2 == 0:
+            _place_word(grid, word, rng)
+    return grid, words
+
+
+def _place_word(grid: [[str]], word: str, rng: random.Random) -> bool:
+    '''
+    Writes a word into the grid at a random start and direction where it
+    fits, returning whether it was placed
+    '''
+    rows, cols = len(grid), len(grid[0])
+    for _ in range(20):
+        dx, dy = rng.choice(search._DIRECTIONS)
+        r, c = rng.randrange(rows), rng.randrange(cols)
+        end_r, end_c = r + dy * (len(word) - 1), c + dx * (len(word) - 1)
+        if 0 <= end_r < rows and 0 <= end_c < cols:
+            for ind, char in enumerate(word):
+                grid[r + ind * dy][c + ind * dx] = char
+            return True
+    return False
+
+
+def render_puzzle(grid: [[str]], cell_size=40) -> 'Image':
+    '''
+    Renders a grid as an RGB image of black letters on a white background
+    '''
+    import cv2
+    import numpy as np
+    image = np.full((len(grid) * cell_size + cell_size, len(grid[0]) * cell_size + cell_size, 3), 255, np.uint8)
+    for r, row in enumerate(grid):
+        for c, char in enumerate(row):
+            origin = (c * cell_size + cell_size * 3 // 4, r * cell_size + cell_size * 3 // 2)
+            cv2.putText(image, char, origin, cv2.FONT_HERSHEY_SIMPLEX, cell_size / 40, (0, 0, 0), 2)
+    return image
+
+
+def _best_time(function, repeat: int) -> float:
+    '''
+    Returns the fastest of repeated runs of a function in seconds
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _search_engines() -> {str: callable}:
+    '''
+    Returns the available search engines, each as a function of the grid and word bank
+    '''
+    def search_each(grid, words):
+        searcher = search.Searcher(grid)
+        return [searcher.search(word) for word in words]
+
+    engines = {
+        'search': search_each,
+        'search_all': lambda grid, words: search.Searcher(grid).search_all(words),
+        'search_every': lambda grid, words: search.Searcher(grid).search_every(words),
+        'sharded': lambda grid, words: sharded.search_sharded(grid, words),
+    }
+    try:
+        import vectorized
+    except ImportError:
+        return engines
+    engines['vectorized'] = lambda grid, words: vectorized.VectorizedSearcher(grid).search_all(words)
+    return engines
+
+
+def bench_search(sizes: [int], bank_sizes: [int], engines: [str] = None, repeat=3, seed=0) -> [dict]:
+    '''
+    Times each search engine on square puzzles of every size and word bank size
+    '''
+    available = _search_engines()
+    results = []
+    for size in sizes:
+        for bank_size in bank_sizes:
+            grid, words = generate_puzzle(size, size, bank_size, seed=seed)
+            for engine in engines or available:
+                seconds = _best_time(lambda: available[engine](grid, words), repeat)
+                results.append({'benchmark': 'search', 'engine': engine, 'rows': size, 'cols': size,
+                                'words': bank_size, 'seconds': seconds})
+                print(f'search {engine:>14} {size}x{size} {bank_size} words: {seconds:.4f}s', file=sys.stderr)
+    return results
+
+
+def bench_ocr(paths: [str], synthetic_sizes: [int], repeat=1, seed=0) -> [dict]:
+    '''
+    Times the OCR pipeline on whole sample images and on rendered
+    synthetic grids, recording the fraction of grid rows read correctly
+    '''
+    import imaging
+    import ocr
+    backend = ocr.get_default_backend()
+    results = []
+    for path in paths:
+        image = imaging.Imaging(path)
+        width, height = image.get_image_dimensions()
+        seconds = _best_time(lambda: image.process_selection((0, 0), (width, height), backend=backend), repeat)
+        results.append({'benchmark': 'ocr', 'engine': type(backend).__name__, 'image': path, 'seconds': seconds})
+        print(f'ocr {path}: {seconds:.4f}s', file=sys.stderr)
+
+    for size in synthetic_sizes:
+        grid, _ = generate_puzzle(size, size, 0, seed=seed)
+        rendered = render_puzzle(grid)
+        height, width = rendered.shape[:2]
+        start = time.perf_counter()
+        text_data = backend.image_to_data(rendered, imaging.WORDSEARCH_CONFIG)
+        seconds = time.perf_counter() - start
+        lines = [line.split('\t')[-1] for line in text_data.splitlines()[1:] if line.count('\t') == 11]
+        lines = [line for line in lines if line.strip()]
+        correct = sum(''.join(row) == line for row, line in zip(grid, search.build_grid(lines)))
+        results.append({'benchmark': 'ocr', 'engine': type(backend).__name__, 'image': f'synthetic {size}x{size}',
+                        'pixels': width * height, 'seconds': seconds, 'accuracy': correct / size})
+        print(f'ocr synthetic {size}x{size}: {seconds:.4f}s, {correct}/{size} rows', file=sys.stderr)
+    return results
+
+
+def bench_import(module='search') -> dict:
+    '''
+    Measures the cumulative import time of a module in a fresh interpreter
+    '''
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True).stderr
+    # the last line of the report is the module itself, with its cumulative time in microseconds
+    match = re.search(rf'\|\s*(\d+)\s*\|\s*{re.escape(module)}\s*$', output, re.MULTILINE)
+    seconds = int(match.group(1)) / 1e6 if match else None
+    print(f'import {module}: {seconds}s', file=sys.stderr)
+    return {'benchmark': 'import', 'engine': module, 'seconds': seconds}
+
+
+def _result_key(result: dict) -> tuple:
+    return tuple((name, value) for name, value in sorted(result.items()) if name not in ('seconds', 'accuracy'))
+
+
+def compare(old: [dict], new: [dict]) -> None:
+    '''
+    Prints the speedup of every benchmark found in both runs
+    '''
+    old_times = {_result_key(result): result['seconds'] for result in old}
+    for result in new:
+        before = old_times.get(_result_key(result))
+        if before and result['seconds']:
+            label = ' '.join(str(value) for _, value in _result_key(result))
+            print(f'{label}: {before:.4f}s -> {result["seconds"]:.4f}s ({before / result["seconds"]:.2f}x)')
+
+
+def _int_list(value: str) -> [int]:
+    return [int(item) for item in value.split(',') if item]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the word search solver.')
+    parser.add_argument('--sizes', type=_int_list, default=[10, 100, 1000],
+                        help='comma separated grid sizes, up to 5000')
+    parser.add_argument('--banks', type=_int_list, default=[10, 100, 1000],
+                        help='comma separated word bank sizes, up to 100000')
+    parser.add_argument('--engines', type=lambda value: value.split(','), default=None,
+                        help='comma separated search engines to time (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per search benchmark, the best is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the puzzle generator')
+    parser.add_argument('--ocr', action='store_true', help='also time the OCR pipeline')
+    parser.add_argument('--images', default='samples/*.jpg', help='glob of images for the OCR benchmark')
+    parser.add_argument('--ocr-sizes', type=_int_list, default=[10, 20], help='sizes of rendered OCR grids')
+    parser.add_argument('--import-budget', type=float, default=None,
+                        help='fail if importing search takes longer than this many seconds')
+    parser.add_argument('--output', help='file to save the results to as JSON')
+    parser.add_argument('--compare', help='results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    results = [bench_import('search')]
+    results += bench_search(args.sizes, args.banks, args.engines, repeat=args.repeat, seed=args.seed)
+    if args.ocr:
+        results += bench_ocr(sorted(glob.glob(args.images)), args.ocr_sizes, seed=args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'python': sys.version, 'platform': platform.platform(), 'time': time.time(),
+                       'results': results}, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file)['results'], results)
+    if args.import_budget is not None and (results[0]['seconds'] or 0) > args.import_budget:
+        sys.exit(f'Importing search took {results[0]["seconds"]}s, over the budget of {args.import_budget}s')
+
+
+if __name__ == '__main__':
+    main()
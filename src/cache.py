@@ -0,0 +1,110 @@
+'''
+The cache.py module implements a persistent on-disk cache of OCR results,
+keyed by the scanned pixels, the tesseract config and the tesseract version
+'''
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'wsvision', 'ocr.sqlite3')
+_DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class OcrCache:
+    '''
+    Stores the text data of scanned images in an SQLite file, evicting
+    the least recently used entries once the cache is larger than max_bytes
+    '''
+    def __init__(self, path=_DEFAULT_PATH, max_bytes=_DEFAULT_MAX_BYTES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._max_bytes = max_bytes
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(image, config: str, version: str) -> str:
+        '''
+        Creates the key of a scanned image from its pixels, the tesseract
+        config and the tesseract version
+        '''
+        digest = hashlib.sha256()
+        digest.update(f'{image.shape}|{image.dtype}|{config}|{version}|'.encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> ([dict] or None):
+        '''
+        Returns the cached text data of a key as a list of dictionaries,
+        or None if the key is not cached
+        '''
+        with self._lock:
+            row = self._connection.execute('SELECT data FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._connection.execute('UPDATE entries SET used = ? WHERE key = ?', (time.time(), key))
+            self._connection.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, text_data: [dict]) -> None:
+        '''
+        Stores the text data of a key and evicts the least recently
+        used entries while the cache is over its size limit
+        '''
+        data = json.dumps(text_data)
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO entries (key, data, size, used) VALUES (?, ?, ?, ?)',
+                (key, data, len(data), time.time()))
+            total = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            while total > self._max_bytes:
+                row = self._connection.execute('SELECT key, size FROM entries ORDER BY used LIMIT 1').fetchone()
+                if row is None:
+                    break
+                self._connection.execute('DELETE FROM entries WHERE key = ?', (row[0],))
+                total -= row[1]
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        '''
+        Returns the hit and miss counters of this cache along with the
+        number of entries and bytes stored
+        '''
+        with self._lock:
+            entries, size = self._connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'hits': self._hits, 'misses': self._misses, 'entries': entries, 'bytes': size}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute('DELETE FROM entries')
+            self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+_default_cache = None
+
+
+def get_default_cache() -> OcrCache:
+    '''
+    Returns the cache in the user's cache directory, opening it on first use
+    '''
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = OcrCache()
+    return _default_cache
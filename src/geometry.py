@@ -3,6 +3,9 @@ The geometry.py module implements functionality for managing and
 drawing shapes on the Tkinter canvas
 '''
 
+import math
+
+
 class Geometry:
     def __init__(self, shape, x, y):
         self._shape = shape
@@ -41,3 +44,33 @@ class Geometry:
     def set_drawable(self, value) -> None:
         self._drawable = value
 
+
+class CanvasTransform:
+    '''
+    Converts coordinates between an image and the canvas it is displayed on
+    '''
+    def __init__(self, img_width, img_height, canvas_width, canvas_height):
+        self._img_width = img_width
+        self._img_height = img_height
+        self._canvas_width = canvas_width
+        self._canvas_height = canvas_height
+
+    def get_canvas_size(self) -> (int, int):
+        return self._canvas_width, self._canvas_height
+
+    def canvas_to_img(self, canvas_x, canvas_y) -> (int, int):
+        '''
+        Converts canvas coordinates to image coordinates
+        '''
+        return math.ceil(canvas_x / self._canvas_width * self._img_width), \
+            math.ceil(canvas_y / self._canvas_height * self._img_height)
+
+    def img_to_canvas(self, img_x, img_y, rounding=True) -> (int, int):
+        '''
+        Converts image coordinates to canvas coordinates
+        '''
+        canvas_x = img_x / self._img_width * self._canvas_width
+        canvas_y = img_y / self._img_height * self._canvas_height
+        if rounding:
+            return math.floor(canvas_x), math.ceil(canvas_y)
+        return canvas_x, canvas_y
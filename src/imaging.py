@@ -1,10 +1,16 @@
 '''
 The imaging.py module implements functionality for reading images
-and extracting textual data using pytesseract and OpenCV
+and extracting textual data using OpenCV and the tesseract backends
+of ocr.py
 '''
 from collections import namedtuple
-import pytesseract
+import threading
+import time
 import cv2
+import numpy as np
+import ocr
+import tracing
+from PIL import Image
 
 
 class TextData:
@@ -17,22 +23,399 @@ class TextData:
         self.conf = conf
 
 
-# Configuration for pytesseract
-pytesseract.pytesseract.tesseract_cmd = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
-_DEFAULT_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1'
+# Configuration for tesseract
+WORDSEARCH_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ1'
+WORDBANK_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1'
+_DEFAULT_CONFIG = WORDBANK_CONFIG
+
+def _estimate_glyph_height(gray) -> (float or None):
+    '''
+    Estimates the height of the glyphs in a grayscale image of dark
+    text on a light background from the median height of its blobs
+    '''
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    # ignore specks of noise
+    heights = heights[(stats[1:, cv2.CC_STAT_AREA] >= 10) & (heights >= 4)]
+    if len(heights) == 0:
+        return None
+    return float(np.median(heights))
+
+
+def _estimate_skew(gray, max_angle=5.0, step=0.5) -> float:
+    '''
+    Estimates the skew of the text lines in degrees as the rotation that
+    gives the sharpest horizontal projection profile
+    '''
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # the profile only needs a small copy of the image
+    scale = min(1.0, 500 / max(mask.shape))
+    if scale < 1.0:
+        mask = cv2.resize(mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    height, width = mask.shape
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), float(angle), 1.0)
+        rotated = cv2.warpAffine(mask, matrix, (width, height), flags=cv2.INTER_NEAREST)
+        score = float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+class Preprocessor:
+    '''
+    Prepares a cropped selection for OCR by converting it to grayscale,
+    rescaling it so its glyphs are glyph_height pixels tall, binarizing it
+    with an adaptive threshold and removing its skew. Rescaling, binarizing
+    and deskewing work on the grayscale image, so they also convert it
+    '''
+    def __init__(self, grayscale=True, glyph_height=None, binarize=False, deskew=False,
+                 block_size=31, offset=15):
+        self._grayscale = grayscale or binarize or deskew or glyph_height is not None
+        self._glyph_height = glyph_height
+        self._binarize = binarize
+        self._deskew = deskew
+        self._block_size = block_size
+        self._offset = offset
+        self._timings = dict()
+
+    def __repr__(self) -> str:
+        return f'Preprocessor(grayscale={self._grayscale}, glyph_height={self._glyph_height}, ' \
+               f'binarize={self._binarize}, deskew={self._deskew}, ' \
+               f'block_size={self._block_size}, offset={self._offset})'
+
+    def get_timings(self) -> {str: float}:
+        '''
+        Returns the seconds spent in each step of the last processed image
+        '''
+        return dict(self._timings)
+
+    def process(self, image) -> ('Image', 'Matrix'):
+        '''
+        Runs the enabled steps on an RGB image and returns the processed image
+        with the 3x3 matrix that maps image coordinates onto the processed image
+        '''
+        self._timings = dict()
+        matrix = np.eye(3)
+
+        if self._grayscale:
+            start = time.perf_counter()
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            self._timings['grayscale'] = time.perf_counter() - start
+
+        if self._glyph_height is not None:
+            start = time.perf_counter()
+            glyph_height = _estimate_glyph_height(image)
+            if glyph_height:
+                scale = self._glyph_height / glyph_height
+                if abs(scale - 1) > 0.1:
+                    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+                    image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+                    matrix = np.diag([scale, scale, 1.0]) @ matrix
+            self._timings['rescale'] = time.perf_counter() - start
+
+        if self._binarize:
+            start = time.perf_counter()
+            image = cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                          self._block_size, self._offset)
+            self._timings['binarize'] = time.perf_counter() - start
+
+        if self._deskew:
+            start = time.perf_counter()
+            angle = _estimate_skew(image)
+            if angle != 0:
+                height, width = image.shape[:2]
+                rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+                image = cv2.warpAffine(image, rotation, (width, height), flags=cv2.INTER_LINEAR,
+                                       borderValue=255)
+                matrix = np.vstack([rotation, [0, 0, 1]]) @ matrix
+            self._timings['deskew'] = time.perf_counter() - start
+
+        return image, matrix
+
+
+def _map_box(matrix, x, y, w, h) -> (int, int, int, int):
+    '''
+    Maps a box through a 3x3 matrix and returns the box around its corners
+    '''
+    corners = np.array([[x, y, 1], [x + w, y, 1], [x, y + h, 1], [x + w, y + h, 1]], dtype=np.float64)
+    mapped = corners @ matrix.T
+    x1, y1 = mapped[:, 0].min(), mapped[:, 1].min()
+    x2, y2 = mapped[:, 0].max(), mapped[:, 1].max()
+    return round(x1), round(y1), round(x2 - x1), round(y2 - y1)
+
+
+def annotate(image, text_data: [TextData]) -> 'Image':
+    '''
+    Returns a copy of an image with the box and text of every text data drawn on it
+    '''
+    annotated = image.copy()
+    for data in text_data:
+        cv2.rectangle(annotated, (data.x, data.y), (data.x + data.w, data.y + data.h), (0, 0, 255), 2)
+        cv2.putText(annotated, data.char, (data.x, data.y), cv2.FONT_HERSHEY_PLAIN, 1.5, (50, 50, 255), 2)
+    return annotated
+
+
+def _find_glyphs(gray) -> ('Stats', float or None):
+    '''
+    Returns the x, y, width and height of the blobs of dark text in a
+    grayscale image that are about the size of a glyph, ignoring specks,
+    rules and pictures, along with the median height of the glyphs
+    '''
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    boxes = stats[1:, :4]
+    boxes = boxes[(stats[1:, cv2.CC_STAT_AREA] >= 10) & (boxes[:, 3] >= 4)]
+    if len(boxes) == 0:
+        return boxes, None
+    glyph_height = float(np.median(boxes[:, 3]))
+    return boxes[(boxes[:, 2] <= 3 * glyph_height) & (boxes[:, 3] <= 3 * glyph_height)], glyph_height
+
+
+def _pad_box(boxes, padding: float, shape) -> (int, int, int, int):
+    '''
+    Returns the corners of the box around the given boxes, padded and
+    clipped to an image of the given shape
+    '''
+    x1 = max(0, int(boxes[:, 0].min() - padding))
+    y1 = max(0, int(boxes[:, 1].min() - padding))
+    x2 = min(shape[1], int((boxes[:, 0] + boxes[:, 2]).max() + padding))
+    y2 = min(shape[0], int((boxes[:, 1] + boxes[:, 3]).max() + padding))
+    return x1, y1, x2, y2
+
+
+def _find_grid(boxes, glyph_height: float) -> ('Stats' or None):
+    '''
+    Finds the glyphs of the letter grid, which are the largest stack of
+    text lines whose glyphs lie on the same evenly spaced columns. Letters
+    of words are closer than a glyph height apart and the spaces between
+    words break the spacing, so lines of text are not stacked
+    '''
+    centers_x = boxes[:, 0] + boxes[:, 2] / 2
+    centers_y = boxes[:, 1] + boxes[:, 3] / 2
+    # group the glyphs into lines by their vertical centers
+    lines = []
+    for index in np.argsort(centers_y):
+        if lines and centers_y[index] - np.mean(centers_y[lines[-1]]) < 0.6 * glyph_height:
+            lines[-1].append(index)
+        else:
+            lines.append([index])
+
+    # a line can hold the glyphs of a grid row and of smaller text beside it, so lines are
+    # first split where the glyph height changes, then at gaps wider than a few of their
+    # usual steps, keeping the evenly spaced segments of at least 4 glyphs
+    runs = []
+    for line in lines:
+        line = sorted(line, key=lambda index: centers_x[index])
+        heights = boxes[line, 3]
+        changes = np.maximum(heights[1:], heights[:-1]) > 1.3 * np.minimum(heights[1:], heights[:-1])
+        start = 0
+        for end in [ind + 1 for ind in np.flatnonzero(changes)] + [len(line)]:
+            runs.append(line[start:end])
+            start = end
+    segments = []
+    for line in runs:
+        if len(line) < 4:
+            continue
+        line_steps = np.diff(centers_x[line])
+        usual_step = float(np.median(line_steps))
+        start = 0
+        for end in [ind + 1 for ind, step in enumerate(line_steps) if step > 2.5 * usual_step] + [len(line)]:
+            segment = line[start:end]
+            start = end
+            if len(segment) < 4:
+                continue
+            # letters may be lost to rules or noise, so steps of whole cells are allowed
+            steps = np.diff(centers_x[segment])
+            pitch = float(np.median(steps))
+            cells = steps / pitch
+            # the grid holds most glyphs, so its letters are about the median height unlike titles
+            height = float(np.median(boxes[segment, 3]))
+            if pitch >= 0.9 * glyph_height and np.all(np.abs(cells - np.round(cells)) < 0.25) and \
+                    np.mean(np.round(cells) == 1) >= 0.75 and 0.75 * glyph_height <= height <= 1.33 * glyph_height:
+                columns = int(round((centers_x[segment[-1]] - centers_x[segment[0]]) / pitch)) + 1
+                segments.append((segment, pitch, float(centers_x[segment[0]]), float(np.mean(centers_y[segment])),
+                                 columns))
+
+    # stack the segments of consecutive rows on the same columns with the same row spacing
+    stacks = []
+    for segment, pitch, left, center, columns in segments:
+        for stack in stacks:
+            spacing = center - stack['center']
+            # the first and last letters of a row are on or next to the first and last columns,
+            # since grid rows hold the same number of letters unlike a list of words
+            shift = (left - stack['left']) / stack['pitch']
+            first = round(shift)
+            last = first + columns - 1
+            if abs(pitch - stack['pitch']) < 0.2 * stack['pitch'] and abs(shift - first) < 0.3 and \
+                    abs(first) <= 1 and abs(last - stack['columns'] + 1) <= 1 and \
+                    0.5 * stack['pitch'] < spacing < 3 * stack['pitch'] and \
+                    (stack['spacing'] is None or abs(spacing - stack['spacing']) < 0.3 * stack['spacing']):
+                stack['segments'].append(segment)
+                stack['center'] = center
+                stack['spacing'] = stack['spacing'] or spacing
+                break
+        else:
+            stacks.append({'segments': [segment], 'pitch': pitch, 'left': left, 'center': center,
+                           'columns': columns, 'spacing': None})
+    stacks = [stack['segments'] for stack in stacks if len(stack['segments']) >= 3]
+    if len(stacks) == 0:
+        return None
+    best = max(stacks, key=lambda segments: sum(len(segment) for segment in segments))
+    return boxes[[index for segment in best for index in segment]]
+
+
+def _find_text_block(boxes, glyph_height: float, shape) -> ('Stats' or None):
+    '''
+    Finds the glyphs of the largest block of text, merging the glyphs of
+    neighbouring words and lines with a dilation, along with the blocks
+    beside it such as the other columns of a word bank
+    '''
+    mask = np.zeros(shape[:2], np.uint8)
+    for x, y, w, h in boxes:
+        mask[y:y + h, x:x + w] = 255
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(1, round(3 * glyph_height)),
+                                                        max(1, round(1.5 * glyph_height))))
+    contours, _ = cv2.findContours(cv2.dilate(mask, kernel), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    blocks = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        inside = (boxes[:, 0] >= x) & (boxes[:, 1] >= y) & \
+                 (boxes[:, 0] + boxes[:, 2] <= x + w) & (boxes[:, 1] + boxes[:, 3] <= y + h)
+        blocks.append((y, y + h, inside))
+    blocks.sort(key=lambda block: int(block[2].sum()), reverse=True)
+    if len(blocks) == 0 or blocks[0][2].sum() < 3:
+        return None
+
+    top, bottom, chosen = blocks[0]
+    merged = True
+    while merged:
+        merged = False
+        for block in blocks[1:]:
+            block_top, block_bottom, inside = block
+            overlap = min(bottom, block_bottom) - max(top, block_top)
+            if overlap >= 0.5 * min(bottom - top, block_bottom - block_top) and (inside & ~chosen).any():
+                top, bottom = min(top, block_top), max(bottom, block_bottom)
+                chosen = chosen | inside
+                merged = True
+    return boxes[chosen]
+
+
+def detect_regions(image) -> ((int, int, int, int) or None, (int, int, int, int) or None):
+    '''
+    Detects the letter grid and the word bank of a puzzle image and returns
+    the corners (x1, y1, x2, y2) of a tight box around each in pixels, or
+    None for a region that is not found. The grid is found from the even
+    spacing of its glyphs and the word bank is the largest block of the
+    remaining text
+    '''
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+    boxes, glyph_height = _find_glyphs(gray)
+    if glyph_height is None or len(boxes) == 0:
+        return None, None
+    padding = glyph_height / 2
+    grid_boxes = _find_grid(boxes, glyph_height)
+    grid = None
+    remaining = boxes
+    if grid_boxes is not None:
+        grid = _pad_box(grid_boxes, padding, gray.shape)
+        # leave out the glyphs of the grid and anything touching it
+        x1, y1, x2, y2 = grid
+        remaining = boxes[(boxes[:, 0] + boxes[:, 2] < x1 - padding) | (boxes[:, 0] > x2 + padding) |
+                          (boxes[:, 1] + boxes[:, 3] < y1 - padding) | (boxes[:, 1] > y2 + padding)]
+    bank_boxes = _find_text_block(remaining, glyph_height, gray.shape) if len(remaining) > 0 else None
+    bank = _pad_box(bank_boxes, padding, gray.shape) if bank_boxes is not None else None
+    return grid, bank
+
+
+# reduced decoding modes of OpenCV by their scale factor
+_REDUCED_MODES = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]
+
 
 class Imaging:
-    def __init__(self, img: str):
-        # read the image
-        self._image = cv2.imread(img)
-        # convert image to rgb
-        self._image = cv2.cvtColor(self._image, cv2.COLOR_BGR2RGB)
-        # get the height and width of image
-        self._image_height, self._image_width, _ = self._image.shape
+    def __init__(self, img: str, preview_size=2000):
+        self._path = img
+        self._preview_size = preview_size
+        self._preview = None
+        # the full resolution image is only loaded once a selection is scanned
+        self._image = None
+        self._image_lock = threading.Lock()
+        # get the height and width of image from its header
+        with Image.open(img) as header:
+            self._image_width, self._image_height = header.size
+            # OpenCV applies the EXIF orientation when decoding
+            if header.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                self._image_width, self._image_height = self._image_height, self._image_width
 
     def get_image(self) -> 'Image':
+        '''
+        Returns a reduced version of the image for display, at least
+        preview_size pixels on its longest side when the image allows
+        '''
+        if self._preview is None:
+            longest = max(self._image_width, self._image_height)
+            mode = cv2.IMREAD_COLOR
+            for factor, reduced_mode in _REDUCED_MODES:
+                if longest // factor >= self._preview_size:
+                    mode = reduced_mode
+                    break
+            with tracing.span('imread_preview'):
+                preview = cv2.imread(self._path, mode)
+            if preview is None:
+                raise ValueError(f'Could not read image {self._path}')
+            self._preview = cv2.cvtColor(preview, cv2.COLOR_BGR2RGB)
+        return self._preview
+
+    def _get_full_image(self) -> 'Image':
+        '''
+        Returns the full resolution image, memory-mapping uncompressed
+        TIFF scans and decoding any other image once on first use
+        '''
+        with self._image_lock:
+            if self._image is None:
+                self._image = self._memory_map()
+            if self._image is None:
+                with tracing.span('imread'):
+                    image = cv2.imread(self._path)
+                if image is None:
+                    raise ValueError(f'Could not read image {self._path}')
+                self._image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         return self._image
 
+    def _memory_map(self) -> ('Image' or None):
+        '''
+        Memory-maps the pixels of an uncompressed TIFF with tifffile if it
+        is installed, or returns None if the image cannot be mapped
+        '''
+        if not self._path.lower().endswith(('.tif', '.tiff')):
+            return None
+        try:
+            import tifffile
+            image = tifffile.memmap(self._path, mode='r')
+        except (ImportError, ValueError):
+            return None
+        if image.shape[:2] != (self._image_height, self._image_width) or image.dtype != np.uint8:
+            return None
+        return image
+
+    def get_path(self) -> str:
+        return self._path
+
+    @tracing.traced('detect_regions')
+    def detect_regions(self) -> ((int, int, int, int) or None, (int, int, int, int) or None):
+        '''
+        Detects the letter grid and the word bank on the preview of the image
+        and returns their boxes in pixels of the full image, see detect_regions
+        '''
+        preview = self.get_image()
+        scale_x = self._image_width / preview.shape[1]
+        scale_y = self._image_height / preview.shape[0]
+        return tuple(None if box is None else (round(box[0] * scale_x), round(box[1] * scale_y),
+                                               round(box[2] * scale_x), round(box[3] * scale_y))
+                     for box in detect_regions(preview))
+
     def get_image_dimensions(self) -> (int, int):
         '''
         Returns the dimensions of the image as a tuple of integers
@@ -46,29 +429,63 @@ class Imaging:
         if x2 < x1:
             x1, x2 = x2, x1
             y1, y2 = y2, y1
-        return self._image[y1:y2, x1:x2].copy()
+        # a view into the image, which is never drawn on
+        cropped_img = self._get_full_image()[y1:y2, x1:x2]
+        if cropped_img.ndim == 2:
+            return cv2.cvtColor(cropped_img, cv2.COLOR_GRAY2RGB)
+        return cropped_img[:, :, :3]
 
 
-    def process_selection(self, coord1, coord2, config=_DEFAULT_CONFIG):
-        cropped_img = self._crop_selection(coord1, coord2)
+    def process_selection(self, coord1, coord2, config=_DEFAULT_CONFIG, backend=None, cache=None,
+                          preprocessor=None, debug=False):
+        '''
+        Extracts the text data in the selection with the given OCR backend,
+        or the default backend if none is given. If a cache is given, a
+        selection that was already scanned is read from the cache instead.
+        If a preprocessor is given, the selection is prepared by it before
+        OCR and the boxes are mapped back to the coordinates of the selection.
+        In debug mode, a copy of the selection annotated with the text data
+        is returned along with it
+        '''
+        if backend is None:
+            backend = ocr.get_default_backend()
+        with tracing.span('crop'):
+            cropped_img = self._crop_selection(coord1, coord2)
+        if cache is not None:
+            with tracing.span('cache_lookup'):
+                key = cache.make_key(cropped_img, f'{config}|{preprocessor!r}', backend.version())
+                cached = cache.get(key)
+            if cached is not None:
+                tracing.count('ocr_cache_hits')
+                all_data = [TextData(**data) for data in cached]
+                return (all_data, annotate(cropped_img, all_data)) if debug else all_data
+        ocr_img, matrix = cropped_img, None
+        if preprocessor is not None:
+            with tracing.span('preprocess'):
+                ocr_img, matrix = preprocessor.process(cropped_img)
+                matrix = np.linalg.inv(matrix)
         all_data = []
 
-        for i, b in enumerate(pytesseract.image_to_data(cropped_img, config=config).splitlines()):
-            # print(b)
-            if i != 0:
-                b = b.split()
-                if len(b) == 12:
-                    x, y, w, h = map(int, b[6:10])
-                    char = b[-1]
-                    conf = float(b[10])
-                    cv2.rectangle(cropped_img, (x, y), (w + x, h + y), (0, 0, 255), 2)
-                    cv2.putText(cropped_img, char, (x, y), cv2.FONT_HERSHEY_PLAIN, 1.5, (50, 50, 255), 2)
-                    all_data.append(TextData(x=x, y=y, w=w, h=h, char=char, conf=conf))
+        with tracing.span('ocr', backend=type(backend).__name__):
+            tsv = backend.image_to_data(ocr_img, config)
+        with tracing.span('parse'):
+            for i, b in enumerate(tsv.splitlines()):
+                # print(b)
+                if i != 0:
+                    b = b.split()
+                    if len(b) == 12:
+                        x, y, w, h = map(int, b[6:10])
+                        char = b[-1]
+                        conf = float(b[10])
+                        if matrix is not None:
+                            x, y, w, h = _map_box(matrix, x, y, w, h)
+                        all_data.append(TextData(x=x, y=y, w=w, h=h, char=char, conf=conf))
+        tracing.count('ocr_boxes', len(all_data))
 
         # print(all_data)
-        # cv2.imshow('Test image', cropped_img)
-        # cv2.waitKey(0)
-        return all_data
+        if cache is not None:
+            cache.put(key, [vars(data) for data in all_data])
+        return (all_data, annotate(cropped_img, all_data)) if debug else all_data
 
 
 # For testing the module
@@ -77,6 +494,7 @@ if __name__ == '__main__':
     imager = Imaging('example_1.jpg')
     # cv2.imshow('Test image', imager.get_image())
     # cv2.waitKey(0)
-    imager.process_selection((55, 107), (531, 565))
+    _, annotated_img = imager.process_selection((55, 107), (531, 565), debug=True)
+    cv2.imshow('Test image', cv2.cvtColor(annotated_img, cv2.COLOR_RGB2BGR))
     cv2.waitKey(0)
 
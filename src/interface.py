@@ -3,18 +3,24 @@ The interface.py module implements functionality for creating
 a user interface to import and view solvable puzzles
 '''
 
-import imaging
-import math
+import cache
 import tkinter
+from concurrent.futures import ThreadPoolExecutor
 import search
+import tracing
 import customtkinter
-from PIL import Image, ImageTk
+from PIL import Image
 from tkinter import filedialog
-from tkinter import scrolledtext
-from geometry import Geometry
+from geometry import CanvasTransform, Geometry
+
+# imaging pulls in cv2 and numpy, so it is only imported once an image is opened, and session
+# and service are only imported when they are used
+
+# letters that may be misread in a word that is not found exactly
+_MAX_MISMATCHES = 1
 
 class SolverApp:
-    def __init__(self) -> None:
+    def __init__(self, server=None) -> None:
         # initialize custom Tkinter
         customtkinter.set_appearance_mode("dark")
         customtkinter.set_default_color_theme("blue")
@@ -50,8 +56,22 @@ class SolverApp:
         self._wordbank_results = None
         self._wordsearch_on_img = None
         self._wordbank_on_img = None
-        self._welcome_image = customtkinter.CTkImage(Image.open('assets/welcome.png'), size=(400,500))
-        self._welcome_image_label = customtkinter.CTkLabel(self._root_window, image=self._welcome_image, height=700, text="")
+        # corners of the scanned selections in image pixels, as they are saved in sessions
+        self._wordsearch_region = None
+        self._wordbank_region = None
+        # pre-scaled copies of the image and the last displayed size, reused across resizes
+        self._display_levels = None
+        self._display_cache = None
+        self._canvas_image_item = None
+        self._resize_job = None
+        # image to canvas transform, replaced whenever the canvas is resized
+        self._transform = None
+        self._canvas_size = None
+        self._canvas.bind('<Configure>', canvas_resizer(self))
+        self._welcome_image = None
+        self._welcome_image_label = customtkinter.CTkLabel(self._root_window, height=700, text="")
+        # decode the welcome image after the window is first shown
+        self._root_window.after_idle(self._load_welcome_image)
 
 
         # for solutions
@@ -60,6 +80,8 @@ class SolverApp:
             bg="#555555", fg="#ffffff", relief=tkinter.FLAT, border="0"
         )
         self._answer_dict = dict()
+        self._approximate_dict = dict()
+        self._searcher = None
         self._puzzle_origin = None
         self._puzzle_unit_x = None
         self._puzzle_unit_y = None
@@ -72,6 +94,12 @@ class SolverApp:
         self._reset_button = customtkinter.CTkButton(
             self._sidebar, text='Reset Solver', command=self._reset_app, font=self._font_button
         )
+        self._open_session_button = customtkinter.CTkButton(
+            self._sidebar, text='Open Session', command=self._open_session, font=self._font_button
+        )
+        self._save_session_button = customtkinter.CTkButton(
+            self._sidebar, text='Save Session', command=self._save_session, font=self._font_button
+        )
         self._process_button = customtkinter.CTkButton(
             self._sidebar, text='Solve', command=self._solve_puzzle, font=self._font_button
         )
@@ -99,6 +127,22 @@ class SolverApp:
         self._confirm_edit_wordsearch_button = customtkinter.CTkButton(
             self._sidebar_right_bottom, text='Update Changes', command=self._update_wordsearch
         )
+        self._cancel_solve_button = customtkinter.CTkButton(
+            self._sidebar, text='Cancel', command=self._cancel_solve, font=self._font_button
+        )
+
+        # scanning runs in the background so the window stays responsive
+        self._solve_executor = ThreadPoolExecutor(max_workers=2)
+        self._solve_futures = None
+        # selections are scanned by a running solver service if its address is given
+        self._client = None
+        if server:
+            import service
+            self._client = service.SolverClient(server)
+        # regions detected in the background after an image is opened, to prefill the selections
+        self._detect_future = None
+        self._solve_progress = customtkinter.CTkProgressBar(self._sidebar, mode='indeterminate')
+        self._solve_status_label = customtkinter.CTkLabel(self._sidebar, text='')
 
         # initialize positions
         # self._menu.grid(
@@ -122,6 +166,9 @@ class SolverApp:
         self._open_button.grid(
             row=1, column=0, sticky='nesw', pady=5
         )
+        self._open_session_button.grid(
+            row=2, column=0, sticky='nesw', pady=5
+        )
         # self._autosolve_mode.grid(
         #     row=0, column=0, sticky='n'
         # )
@@ -144,11 +191,19 @@ class SolverApp:
         self._select_wordsearch_label = customtkinter.CTkLabel(self._sidebar_bottom, text='Select the puzzle area.')
         self._select_wordbank_label = customtkinter.CTkLabel(self._sidebar_bottom, text='Select the wordbank area.')
 
+    def _load_welcome_image(self) -> None:
+        '''
+        Loads the welcome image into its label
+        '''
+        self._welcome_image = customtkinter.CTkImage(Image.open('assets/welcome.png'), size=(400,500))
+        self._welcome_image_label.configure(image=self._welcome_image)
+
     def _reset_app(self) -> None:
         '''
         Resets the application to its original state.
         '''
         # remove buttons
+        self._cancel_solve()
         self._puzzle_select_button.grid_forget()
         self._word_bank_select_button.grid_forget()
         self._process_button.grid_forget()
@@ -163,11 +218,15 @@ class SolverApp:
         self._word_select_list.grid_forget()
         self._sidebar_bottom.grid_forget()
         self._sidebar_right_bottom.grid_forget()
+        self._save_session_button.grid_forget()
 
         # add buttons
         self._open_button.grid(
             row=1, column=0, sticky='nesw'
         )
+        self._open_session_button.grid(
+            row=2, column=0, sticky='nesw', pady=5
+        )
 
         # reset attributes
         self._puzzle_select_button.configure(state="normal")
@@ -176,6 +235,7 @@ class SolverApp:
         self._end_selection()
         self._bounding_box = None
         self._image_object = None
+        self._detect_future = None
         self._wordsearch_info = None
         self._wordsearch_content = []
         self._wordbank_content = []
@@ -184,11 +244,20 @@ class SolverApp:
         self._wordbank_results = None
         self._wordsearch_on_img = None
         self._wordbank_on_img = None
+        self._wordsearch_region = None
+        self._wordbank_region = None
+        self._display_levels = None
+        self._display_cache = None
+        self._transform = None
         self._answer_dict = dict()
+        self._approximate_dict = dict()
+        self._searcher = None
         self._puzzle_origin = None
         self._puzzle_unit_x = None
         self._puzzle_unit_y = None
         self._answer_marking_dict = dict()
+        # the image item is reused by the next image, so the lines over it are removed
+        self._canvas.delete('solution-line')
 
         self._canvas.grid_forget()
         self._welcome_image_label.grid(
@@ -198,22 +267,41 @@ class SolverApp:
         )
 
 
-    def _convert_image(self) -> 'PhotoImage':
+    def _build_display_levels(self) -> None:
         '''
-        Converts the cv2 image into a format supported by Tkinter to display
+        Builds a pyramid of the image, halving its size down to 256 pixels tall
         '''
         # convert cv2 image to PIL
-        to_display = Image.fromarray(self._image_object.get_image())
+        self._display_levels = [Image.fromarray(self._image_object.get_image())]
+        while self._display_levels[-1].height // 2 >= 256:
+            self._display_levels.append(self._display_levels[-1].reduce(2))
 
-        # resize image
+    @tracing.traced('display')
+    def _convert_image(self) -> 'PhotoImage':
+        '''
+        Converts the cv2 image into a format supported by Tkinter to display,
+        reusing the last converted image while the window height is unchanged
+        '''
         img_width, img_height = self._image_object.get_image_dimensions()
         window_height = self._root_window.winfo_height()
+        if self._display_cache and self._display_cache[0] == window_height:
+            return self._display_cache[1]
+
+        # resize the smallest level of the pyramid that is still tall enough
+        if self._display_levels is None:
+            self._build_display_levels()
+        to_display = self._display_levels[0]
+        for level in self._display_levels:
+            if level.height >= window_height:
+                to_display = level
         to_display = to_display.resize((window_height * img_width // img_height, window_height))
         # resize canvas
         self._canvas.configure(width=(window_height * img_width // img_height), height=window_height)
 
         # convert PIL image to ImageTk
+        from PIL import ImageTk
         to_display = ImageTk.PhotoImage(to_display)
+        self._display_cache = window_height, to_display
         return to_display
 
     def _open_image(self) -> None:
@@ -221,12 +309,17 @@ class SolverApp:
         Prompts the user to select and image and
         displays it in the interface
         '''
+        import imaging
         try:
             # prompt user to open an image
             path = filedialog.askopenfilename()
             # update current image
             self._image_object = imaging.Imaging(path)
+            self._display_levels = None
+            self._display_cache = None
+            self._transform = None
             self._update_image()
+            self._detect_future = self._solve_executor.submit(self._image_object.detect_regions)
         except Exception as e:
             print(e)
         else:
@@ -238,25 +331,30 @@ class SolverApp:
         '''
         image_updater(self)()
 
+    def _get_transform(self) -> CanvasTransform:
+        '''
+        Returns the transform between the image and the canvas, creating
+        it only after the image changed or the canvas was resized
+        '''
+        if self._transform is None:
+            if self._canvas_size is None:
+                # the canvas has not reported its size yet
+                self._canvas.update()
+                self._canvas_size = self._canvas.winfo_width(), self._canvas.winfo_height()
+            self._transform = CanvasTransform(*self._image_object.get_image_dimensions(), *self._canvas_size)
+        return self._transform
+
     def canvas_to_img(self, canvas_x, canvas_y) -> (int, int):
         '''
         Converts canvas coordinates to image coordinates
         '''
-        img_width, img_height = self._image_object.get_image_dimensions()
-        self._canvas.update()
-        canvas_width, canvas_height = self._canvas.winfo_width(), self._canvas.winfo_height()
-        return math.ceil(canvas_x / canvas_width * img_width), math.ceil(canvas_y / canvas_height * img_height)
+        return self._get_transform().canvas_to_img(canvas_x, canvas_y)
 
     def img_to_canvas(self, img_x, img_y, rounding=True) -> (int, int):
         '''
         Converts image coordinates to canvas coordinates
         '''
-        img_width, img_height = self._image_object.get_image_dimensions()
-        self._canvas.update()
-        canvas_width, canvas_height = self._canvas.winfo_width(), self._canvas.winfo_height()
-        if rounding:
-            return math.floor(img_x / img_width * canvas_width), math.ceil(img_y / img_height * canvas_height)
-        return img_x / img_width * canvas_width, img_y / img_height * canvas_height
+        return self._get_transform().img_to_canvas(img_x, img_y, rounding)
 
     def _begin_wordsearch_select_mode(self) -> None:
         '''
@@ -269,6 +367,7 @@ class SolverApp:
             row=1, column=3, columnspan=2, sticky='N', pady=5
         )
         self._open_button.grid_forget()
+        self._open_session_button.grid_forget()
         self._puzzle_select_button.grid(
             row=1, column=0, sticky='nesw', pady=5
         )
@@ -302,6 +401,7 @@ class SolverApp:
         self._canvas.bind('<Button-1>', bounding_box_begin(self))
         self._canvas.bind('<B1-Motion>', bounding_box_edit(self))
         self._canvas.bind('<ButtonRelease-1>', bounding_box_finish(self))
+        self._prefill_selection(0)
         # edit buttons
         self._redo_select_button.grid(
             row=1, column=0, sticky='nesw', pady=5
@@ -316,6 +416,29 @@ class SolverApp:
             row=0, column=0, pady=5
         )
 
+    def _prefill_selection(self, index) -> None:
+        '''
+        Draws the detected word search or word bank region, at the given
+        index, as the selection so it only needs to be confirmed, once the
+        detection has finished and found it
+        '''
+        if self._detect_future is None or not self._detect_future.done():
+            return
+        try:
+            box = self._detect_future.result()[index]
+        except Exception as e:
+            print(e)
+            return
+        if box is None:
+            return
+        x1, y1 = self.img_to_canvas(box[0], box[1])
+        x2, y2 = self.img_to_canvas(box[2], box[3])
+        shape = self._canvas.create_rectangle(x1, y1, x2, y2, tags='bounding-box', outline='blue', width=2)
+        self._bounding_box = Geometry(shape, x1, y1)
+        self._bounding_box.set_end_x(x2)
+        self._bounding_box.set_end_y(y2)
+        self._bounding_box.set_drawable(False)
+
     def _reset_select(self) -> None:
         '''
         Resets the selection process for the bounding box
@@ -348,6 +471,7 @@ class SolverApp:
         self._canvas.bind('<Button-1>', bounding_box_begin(self))
         self._canvas.bind('<B1-Motion>', bounding_box_edit(self))
         self._canvas.bind('<ButtonRelease-1>', bounding_box_finish(self))
+        self._prefill_selection(1)
         # edit buttons
         self._redo_select_button.grid(
             row=1, column=0, sticky='nesw', pady=5
@@ -400,42 +524,194 @@ class SolverApp:
         x1, y1 = self._wordsearch_info.get_x(), self._wordsearch_info.get_y()
         x2, y2 = self._wordsearch_info.get_end_x(), self._wordsearch_info.get_end_y()
         # print(x1, y1, x2, y2)
-        self._wordsearch_results = self._image_object.process_selection(
-            self.canvas_to_img(x1, y1), self.canvas_to_img(x2, y2),
-            config=r'--oem 3 --psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ1')
+        self._wordsearch_region = (*self.canvas_to_img(x1, y1), *self.canvas_to_img(x2, y2))
+        self._wordsearch_on_img = self._wordsearch_region[:2]
+        wordsearch_future = self._solve_executor.submit(
+            self._scan_selection, self._wordsearch_region[:2], self._wordsearch_region[2:], 'wordsearch')
 
         # wordbank section
         x1, y1 = self._wordbank_info.get_x(), self._wordbank_info.get_y()
         x2, y2 = self._wordbank_info.get_end_x(), self._wordbank_info.get_end_y()
         # print(x1, y1, x2, y2)
-        self._wordbank_results = self._image_object.process_selection(
-            self.canvas_to_img(x1, y1), self.canvas_to_img(x2, y2),
-            config=r'--oem 3 --psm 6 -c tessedit_char_whitelist=abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1')
+        self._wordbank_region = (*self.canvas_to_img(x1, y1), *self.canvas_to_img(x2, y2))
+        self._wordbank_on_img = self._wordbank_region[:2]
+        wordbank_future = self._solve_executor.submit(
+            self._scan_selection, self._wordbank_region[:2], self._wordbank_region[2:], 'wordbank')
+
+        # show progress while both sections are scanned
+        self._solve_futures = (wordsearch_future, wordbank_future)
+        self._solve_progress.grid(
+            row=3, column=0, sticky='nesw', pady=5
+        )
+        self._solve_progress.start()
+        self._solve_status_label.configure(text='Scanning 0/2')
+        self._solve_status_label.grid(
+            row=4, column=0, pady=5
+        )
+        self._cancel_solve_button.grid(
+            row=5, column=0, sticky='nesw', pady=5
+        )
+        self._root_window.after(100, self._check_solve_progress, self._solve_futures)
+
+    def _scan_selection(self, coord1, coord2, config_name) -> ['TextData']:
+        '''
+        Scans a selection of the image with the wordsearch or wordbank
+        config, using the solver service when one is connected
+        '''
+        import imaging
+        if self._client is not None:
+            return [imaging.TextData(**data) for data in
+                    self._client.scan(self._image_object.get_path(), coord1, coord2, config_name)]
+        config = imaging.WORDSEARCH_CONFIG if config_name == 'wordsearch' else imaging.WORDBANK_CONFIG
+        return self._image_object.process_selection(coord1, coord2, config=config, cache=cache.get_default_cache())
+
+    def _check_solve_progress(self, futures) -> None:
+        '''
+        Polls the background scans and finishes solving once both are done
+        '''
+        if futures is not self._solve_futures:
+            # the solve was cancelled or replaced
+            return
+        finished = sum(future.done() for future in futures)
+        if finished < len(futures):
+            self._solve_status_label.configure(text=f'Scanning {finished}/{len(futures)}')
+            self._root_window.after(100, self._check_solve_progress, futures)
+            return
+
+        self._hide_solve_progress()
+        try:
+            self._wordsearch_results, self._wordbank_results = (future.result() for future in futures)
+        except Exception as e:
+            print(e)
+            self._restore_solve_buttons()
+            return
 
         self.create_solution()
+        self._show_solution()
 
-        # insert widgets
+    def _show_solution(self) -> None:
+        '''
+        Shows the list of words to solve and the button to save the session
+        '''
         self._word_select_list_label.grid(
             row=0, column=0
         )
         self._word_select_list.grid(
             row=1, column=0
         )
+        self._save_session_button.grid(
+            row=6, column=0, sticky='nesw', pady=5
+        )
+
+    def _save_session(self) -> None:
+        '''
+        Prompts the user for a file and saves the solved puzzle to it
+        '''
+        import session
+        try:
+            path = filedialog.asksaveasfilename(defaultextension='.wsv',
+                                                filetypes=[('Word search session', '*.wsv')])
+            if not path:
+                return
+            # the corners that were scanned, which do not depend on the size of the window
+            session.Session(
+                self._image_object.get_path(), self._image_object.get_image_dimensions(),
+                self._wordsearch_region, self._wordbank_region,
+                [vars(result) for result in self._wordsearch_results],
+                [vars(result) for result in self._wordbank_results], self._wordsearch_content,
+                self._wordbank_content, self._answer_dict, self._approximate_dict,
+                preview=self._image_object.get_image()).save(path)
+        except Exception as e:
+            print(e)
+
+    def _open_session(self) -> None:
+        '''
+        Prompts the user for a session file and shows its solved puzzle
+        without scanning the image again
+        '''
+        import imaging
+        import session
+        try:
+            path = filedialog.askopenfilename(filetypes=[('Word search session', '*.wsv')])
+            if not path:
+                return
+            loaded = session.Session.load(path)
+        except Exception as e:
+            print(e)
+            return
+        # the session stands in for the image and only decodes its preview
+        self._image_object = loaded
+        self._display_levels = None
+        self._display_cache = None
+        self._transform = None
+        self._update_image()
+        self._begin_wordsearch_select_mode()
+        self._puzzle_select_button.grid_forget()
+        self._word_bank_select_button.grid_forget()
+
+        self._wordsearch_results = [imaging.TextData(**data) for data in loaded.get_wordsearch_data()]
+        self._wordbank_results = [imaging.TextData(**data) for data in loaded.get_wordbank_data()]
+        selections = []
+        for x1, y1, x2, y2 in (loaded.get_wordsearch_region(), loaded.get_wordbank_region()):
+            selection = Geometry(None, *self.img_to_canvas(x1, y1))
+            selection.set_end_x(self.img_to_canvas(x2, y2)[0])
+            selection.set_end_y(self.img_to_canvas(x2, y2)[1])
+            selections.append(selection)
+        self._wordsearch_info, self._wordbank_info = selections
+        self._wordsearch_region = loaded.get_wordsearch_region()
+        self._wordbank_region = loaded.get_wordbank_region()
+        self._wordsearch_on_img = loaded.get_wordsearch_region()[:2]
+        self._wordbank_on_img = loaded.get_wordbank_region()[:2]
+        self._wordsearch_content = loaded.get_grid()
+        self._wordbank_content = loaded.get_wordbank()
+        self._calculate_units()
+        # the saved solutions and near matches are kept since no cell changed
+        self._answer_dict = dict(loaded.get_answers())
+        self.solve_and_update(changed=set(), approximate=loaded.get_approximate())
+        self._show_solution()
 
 
 
+    def _cancel_solve(self) -> None:
+        '''
+        Cancels the background scans and returns to the selection step
+        '''
+        if self._solve_futures is None:
+            return
+        for future in self._solve_futures:
+            future.cancel()
+        self._hide_solve_progress()
+        self._restore_solve_buttons()
+
+    def _hide_solve_progress(self) -> None:
+        '''
+        Removes the progress widgets of a solve
+        '''
+        self._solve_futures = None
+        self._solve_progress.stop()
+        self._solve_progress.grid_forget()
+        self._solve_status_label.grid_forget()
+        self._cancel_solve_button.grid_forget()
+
+    def _restore_solve_buttons(self) -> None:
+        '''
+        Shows the selection and solve buttons again after a solve is stopped
+        '''
+        self._puzzle_select_button.grid(
+            row=1, column=0, sticky='nesw', pady=5
+        )
+        self._word_bank_select_button.grid(
+            row=2, column=0, sticky='nesw', pady=5
+        )
+        self._check_to_solve()
+
+    @tracing.traced('create_solution')
     def create_solution(self) -> None:
         '''
         Creates solution for puzzle after reading data
         '''
         # create a 2-D list with the current data
-        self._wordsearch_content = []
-
-        for ind, result in enumerate(self._wordsearch_results):
-            line_as_char = []
-            for char in result.char:
-                line_as_char.append(char if char != '1' else 'I')
-            self._wordsearch_content.append(line_as_char)
+        self._wordsearch_content = search.build_grid([result.char for result in self._wordsearch_results])
 
         self._calculate_units()
         # print(self._wordsearch_content)
@@ -453,21 +729,39 @@ class SolverApp:
         self._puzzle_unit_x = self._puzzle_unit_y
         # print('units', self._puzzle_unit_x, self._puzzle_unit_y)
 
-    def solve_and_update(self) -> None:
+    @tracing.traced('solve')
+    def solve_and_update(self, changed=None, approximate=None) -> None:
         '''
-        Solves the puzzle and updates the answer dictionary
+        Solves the puzzle and updates the answer dictionary. When changed
+        holds the cells edited since the last solve, words that were already
+        solved are only searched again around those cells, and approximate
+        holds saved near matches of the words that are not found
         '''
-        # solve the wordsearch
-        searcher = search.Searcher(self._wordsearch_content)
+        # solve the wordsearch, reusing the searcher and its line index while the grid is unchanged
+        if self._searcher is None or self._searcher.get_contents() != self._wordsearch_content:
+            self._searcher = search.Searcher(self._wordsearch_content)
 
         self._word_select_list.delete(0, tkinter.END)
 
         print('Updating answers')
         # insert words into word list
-        for index, result in enumerate(self._wordbank_content):
-            word = result.upper()
+        words = [result.upper() for result in self._wordbank_content]
+        if changed is None:
+            answers = self._searcher.search_all(words)
+        else:
+            answers = self._searcher.search_all([word for word in words if word not in self._answer_dict])
+            for word in words:
+                if word not in answers:
+                    answers[word] = self._searcher.research(word, self._answer_dict[word], changed)
+        self._answer_dict = dict()
+        for index, word in enumerate(words):
             self._word_select_list.insert(index, word)
-            self._answer_dict[word] = searcher.search(word)
+            self._answer_dict[word] = answers[word]
+        # words that are not found are matched allowing misread letters, keeping the best match
+        if approximate is None:
+            missing = [word for word in words if answers[word] is None]
+            approximate = self._searcher.search_approximate(missing, _MAX_MISMATCHES, self._cell_confidence())
+        self._approximate_dict = {word: found[:1] for word, found in approximate.items() if found}
         # print(self._answer_dict)
         self._word_select_list.bind('<<ListboxSelect>>', _word_selector(self))
 
@@ -482,22 +776,47 @@ class SolverApp:
         for line_list in self._wordbank_content:
             self._edit_wordbank_form.insert('end', ''.join(line_list) + '\n')
 
+    def _cell_confidence(self) -> ([[float]] or None):
+        '''
+        Returns the OCR confidence of each cell of the grid, which is the
+        confidence of its scanned row, or None if rows were added or removed
+        '''
+        if self._wordsearch_results is None or len(self._wordsearch_results) != len(self._wordsearch_content):
+            return None
+        return [[result.conf] * len(row) for result, row in zip(self._wordsearch_results, self._wordsearch_content)]
+
     def draw_solution(self, word) -> None:
         '''
         Draws a solution for the given word
         '''
+        self.draw_solutions([word])
+
+    @tracing.traced('draw')
+    def draw_solutions(self, words) -> None:
+        '''
+        Draws the solutions of all the given words in one pass,
+        computing the puzzle origin and units only once
+        '''
         # update puzzle units
+        self._calculate_units()
         self._create_puzzle_origin()
         origin_x, origin_y = self._puzzle_origin[0], self._puzzle_origin[1]
-        found_search_list = self._answer_dict[word]
-        for fs in found_search_list:
-            # print(fs.r, fs.c)
-            x1, y1 = origin_x + (self._puzzle_unit_x * fs.c), origin_y + (self._puzzle_unit_y * fs.r)
-            x2, y2 = x1 + (fs.dx * (len(word) - 0.5) * self._puzzle_unit_x), y1 + \
-                     (fs.dy * (len(word) - 0.5) * self._puzzle_unit_y)
-            self._canvas.create_line(
-                x1, y1, x2, y2,
-                tags='solution-line', fill='green', stipple='gray50', width=8)
+        unit_x, unit_y = self._puzzle_unit_x, self._puzzle_unit_y
+        for word in words:
+            found_search_list = self._answer_dict.get(word) or []
+            # words only found with misread letters are marked in a different color
+            color = 'green'
+            if len(found_search_list) == 0:
+                found_search_list = self._approximate_dict.get(word) or []
+                color = 'orange'
+            length = len(word) - 0.5
+            for fs in found_search_list:
+                # print(fs.r, fs.c)
+                x1, y1 = origin_x + (unit_x * fs.c), origin_y + (unit_y * fs.r)
+                x2, y2 = x1 + (fs.dx * length * unit_x), y1 + (fs.dy * length * unit_y)
+                self._canvas.create_line(
+                    x1, y1, x2, y2,
+                    tags='solution-line', fill=color, stipple='gray50', width=8)
 
     def _create_puzzle_origin(self) -> None:
         '''
@@ -523,10 +842,12 @@ class SolverApp:
         new_wordbank_content = [line for line in wordbank_content.splitlines()]
         self._edit_wordsearch_form.delete('1.0', tkinter.END)
         self._edit_wordbank_form.delete('1.0', tkinter.END)
+        # only the edited cells need to be searched again if the grid kept its shape
+        changed = search.changed_cells(self._wordsearch_content, new_wordsearch_content)
         self._wordsearch_content = new_wordsearch_content
         self._wordbank_content = new_wordbank_content
         # print(self._wordbank_content)
-        self.solve_and_update()
+        self.solve_and_update(changed)
         self._calculate_units()
         # print(new_wordsearch_content)
 
@@ -585,41 +906,74 @@ def bounding_box_finish(self) -> callable:
     return _finish_draw
 
 
-def image_updater(self, convert=False) -> callable:
+def image_updater(self, convert=False, delay=150) -> callable:
     def _update(event=None) -> None:
         '''
-        Updates the current image displayed
+        Updates the current image displayed. Resize events are debounced
+        so the image is only converted once the window stops changing size
         '''
+        if event is not None:
+            # configure events of child widgets do not resize the image
+            if event.widget is not self._root_window:
+                return
+            if self._resize_job is not None:
+                self._root_window.after_cancel(self._resize_job)
+            self._resize_job = self._root_window.after(delay, _update)
+            return
+
+        self._resize_job = None
         if self._image_object:
             # update the image
             to_display = self._convert_image()
 
-            # update the image panel
-            self._canvas.create_image(0, 0, image=to_display, anchor=tkinter.NW)
+            # update the image panel, reusing its canvas item
+            if self._canvas_image_item is None:
+                self._canvas_image_item = self._canvas.create_image(0, 0, image=to_display, anchor=tkinter.NW)
+            else:
+                self._canvas.itemconfigure(self._canvas_image_item, image=to_display)
             # set an attribute to the label in order for the image to render correctly
             self._canvas.image = to_display
 
     return _update
 
 
+def canvas_resizer(self) -> callable:
+    def _resize(event) -> None:
+        '''
+        Replaces the image to canvas transform when the canvas changes size
+        '''
+        if self._canvas_size != (event.width, event.height):
+            self._canvas_size = event.width, event.height
+            self._transform = None
+            # solution lines are in canvas coordinates, so the selected words are drawn again
+            if self._canvas.find_withtag('solution-line'):
+                self._canvas.delete('solution-line')
+                selection_names = [self._word_select_list.get(index)
+                                   for index in self._word_select_list.curselection()]
+                try:
+                    self.draw_solutions(selection_names)
+                except Exception as e:
+                    print(e)
+                    print('Failed to draw solution')
+
+    return _resize
+
+
 def _word_selector(self) -> callable:
     def _select(event=None) -> None:
         '''
         Handles the selection of a word
         '''
         selections = event.widget.curselection()
-        self._calculate_units()
         self._canvas.delete('solution-line')
         # print(selections)
-        for index in selections:
-            selection_name = event.widget.get(index)  # returns the indices selected in the listbox
-            # solve this data
-            # print(self._answer_dict[selection_name])
-            try:
-                self.draw_solution(selection_name)
-            except Exception as e:
-                print(e)
-                print('Failed to draw solution')
+        # returns the words at the indices selected in the listbox
+        selection_names = [event.widget.get(index) for index in selections]
+        try:
+            self.draw_solutions(selection_names)
+        except Exception as e:
+            print(e)
+            print('Failed to draw solution')
 
     return _select
 
@@ -1,4 +1,12 @@
+import argparse
 import interface
+import tracing
 
 if __name__ == '__main__':
-    interface.SolverApp().run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Word search solver')
+    parser.add_argument('--trace', help='record the time of each solver stage to this JSON or .trace file')
+    parser.add_argument('--server', help='address of a running solver service to scan with, see service.py')
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+    interface.SolverApp(server=args.server).run()
\ No newline at end of file
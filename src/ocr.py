@@ -0,0 +1,288 @@
+'''
+The ocr.py module implements the backends that extract textual data from
+images, through pytesseract, by piping images to a tesseract process or
+through tesseract instances that are kept loaded between images
+'''
+
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# header of the tsv output of tesseract, which the tesserocr api leaves out
+_TSV_HEADER = 'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext'
+_TESSERACT_CMD = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
+
+
+class OcrBackend:
+    def image_to_data(self, image, config: str) -> str:
+        '''
+        Returns the tesseract tsv output for an RGB or grayscale image
+        '''
+        raise NotImplementedError
+
+    def version(self) -> str:
+        '''
+        Returns the version of tesseract used by the backend
+        '''
+        raise NotImplementedError
+
+    def close(self) -> None:
+        '''
+        Releases the resources held by the backend
+        '''
+        pass
+
+
+class PytesseractBackend(OcrBackend):
+    '''
+    Runs a new tesseract process for every image through pytesseract
+    '''
+    def __init__(self, tesseract_cmd=None):
+        import pytesseract
+        tesseract_cmd = tesseract_cmd or _find_tesseract()
+        # pytesseract keeps its own lookup when the binary is not found
+        if tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+        self._pytesseract = pytesseract
+        self._version = None
+
+    def image_to_data(self, image, config: str) -> str:
+        return self._pytesseract.image_to_data(image, config=config)
+
+    def version(self) -> str:
+        if self._version is None:
+            self._version = str(self._pytesseract.get_tesseract_version())
+        return self._version
+
+
+def _find_tesseract() -> (str or None):
+    '''
+    Returns the path of the tesseract binary in its install directory
+    or on the PATH, or None if it is not found
+    '''
+    if os.path.isfile(_TESSERACT_CMD):
+        return _TESSERACT_CMD
+    return shutil.which('tesseract')
+
+
+def _encode_pnm(image) -> bytes:
+    '''
+    Encodes an RGB or grayscale image as a binary PPM or PGM buffer
+    '''
+    height, width = image.shape[:2]
+    magic = b'P5' if image.ndim == 2 else b'P6'
+    return b'%s\n%d %d\n255\n' % (magic, width, height) + image.tobytes()
+
+
+class TesseractPipeBackend(OcrBackend):
+    '''
+    Runs a new tesseract process for every image, feeding it the raw
+    pixels as a PNM buffer over stdin instead of a temporary image file
+    '''
+    def __init__(self, tesseract_cmd=None):
+        self._tesseract_cmd = tesseract_cmd or _find_tesseract() or _TESSERACT_CMD
+        self._version = None
+
+    def image_to_data(self, image, config: str) -> str:
+        args = [self._tesseract_cmd, 'stdin', 'stdout', *shlex.split(config), 'tsv']
+        result = subprocess.run(args, input=_encode_pnm(image), capture_output=True, check=True)
+        return result.stdout.decode('utf-8')
+
+    def version(self) -> str:
+        if self._version is None:
+            result = subprocess.run([self._tesseract_cmd, '--version'], capture_output=True, check=True)
+            # the version is the first line of the output, which older versions print to stderr
+            output = (result.stdout or result.stderr).decode('utf-8')
+            self._version = output.splitlines()[0].split()[-1]
+        return self._version
+
+
+def _parse_config(config: str) -> (int, int, {str: str}):
+    '''
+    Parses a tesseract command line config into its engine mode,
+    page segmentation mode and -c variables
+    '''
+    oem, psm, variables = 3, 3, dict()
+    args = shlex.split(config)
+    for i, arg in enumerate(args[:-1]):
+        if arg == '--oem':
+            oem = int(args[i + 1])
+        elif arg == '--psm':
+            psm = int(args[i + 1])
+        elif arg == '-c':
+            name, value = args[i + 1].split('=', 1)
+            variables[name] = value
+    return oem, psm, variables
+
+
+class TesseractApi(OcrBackend):
+    '''
+    Keeps a loaded tesseract api for every config in this process through
+    tesserocr, so the language model is only loaded once per thread
+    '''
+    def __init__(self, language='eng'):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._language = language
+        self._local = threading.local()
+        self._all_apis = []
+
+    def _get_api(self, config: str) -> 'PyTessBaseAPI':
+        '''
+        Returns the api of this thread for a config, creating it on first use
+        '''
+        apis = self._local.__dict__.setdefault('apis', dict())
+        if config not in apis:
+            oem, psm, variables = _parse_config(config)
+            api = self._tesserocr.PyTessBaseAPI(lang=self._language, oem=oem, psm=psm)
+            for name, value in variables.items():
+                api.SetVariable(name, value)
+            apis[config] = api
+            self._all_apis.append(api)
+        return apis[config]
+
+    def image_to_data(self, image, config: str) -> str:
+        api = self._get_api(config)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        return _TSV_HEADER + '\n' + api.GetTSVText(0)
+
+    def version(self) -> str:
+        return self._tesserocr.tesseract_version()
+
+    def close(self) -> None:
+        for api in self._all_apis:
+            api.End()
+        self._all_apis = []
+        self._local = threading.local()
+
+
+# the api of a worker process in TesseractWorkerPool
+_worker_api = None
+
+
+def _init_worker(language: str) -> None:
+    global _worker_api
+    _worker_api = TesseractApi(language)
+
+
+def _worker_image_to_data(image, config: str) -> str:
+    return _worker_api.image_to_data(image, config)
+
+
+class RecyclingProcessPool:
+    '''
+    A process pool that is replaced once its workers have run max_jobs
+    tasks each on average. The max_tasks_per_child option of
+    ProcessPoolExecutor needs Python 3.11 and can hang before 3.12, so
+    the workers are recycled by replacing the pool instead, waiting for
+    the old pool to finish so no more than workers processes ever run
+    '''
+    def __init__(self, workers=None, max_jobs=200, **kwargs):
+        self._workers = workers or os.cpu_count() or 1
+        self._max_jobs = max_jobs
+        self._kwargs = kwargs
+        self._submitted = 0
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(max_workers=self._workers, **kwargs)
+
+    def submit(self, function, *args) -> 'Future':
+        with self._lock:
+            if self._submitted >= self._workers * self._max_jobs:
+                self._executor.shutdown(wait=True)
+                self._executor = ProcessPoolExecutor(max_workers=self._workers, **self._kwargs)
+                self._submitted = 0
+            self._submitted += 1
+            return self._executor.submit(function, *args)
+
+    def get_workers(self) -> int:
+        return self._workers
+
+    def shutdown(self, wait=True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        return False
+
+
+class TesseractWorkerPool(OcrBackend):
+    '''
+    Keeps tesseract loaded in long-lived worker processes that receive
+    images over pipes, replacing each worker after max_jobs images
+    '''
+    def __init__(self, workers=2, max_jobs=200, language='eng'):
+        self._executor = RecyclingProcessPool(workers, max_jobs, initializer=_init_worker, initargs=(language,))
+
+    def submit(self, image, config: str) -> 'Future':
+        '''
+        Queues an image and returns a future of its tsv output
+        '''
+        return self._executor.submit(_worker_image_to_data, image, config)
+
+    def image_to_data(self, image, config: str) -> str:
+        return self.submit(image, config).result()
+
+    def version(self) -> str:
+        import tesserocr
+        return tesserocr.tesseract_version()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+
+def has_tesserocr() -> bool:
+    '''
+    Returns whether tesserocr is installed to keep tesseract loaded
+    '''
+    try:
+        import tesserocr
+    except ImportError:
+        return False
+    return True
+
+
+def create_backend(workers=None, max_jobs=200, kind=None) -> OcrBackend:
+    '''
+    Creates a backend of the given kind, which is 'tesserocr', 'pipe' or
+    'pytesseract'. By default tesseract is kept loaded when tesserocr is
+    installed, in a pool of worker processes if workers is given, images
+    are piped to the tesseract binary when it is found, and pytesseract
+    is used otherwise
+    '''
+    if kind is None:
+        kind = 'tesserocr' if has_tesserocr() else 'pipe' if _find_tesseract() else 'pytesseract'
+    if kind == 'pytesseract':
+        return PytesseractBackend()
+    if kind == 'pipe':
+        return TesseractPipeBackend()
+    if kind != 'tesserocr':
+        raise ValueError(f'Unknown OCR backend {kind}')
+    if workers:
+        return TesseractWorkerPool(workers=workers, max_jobs=max_jobs)
+    return TesseractApi()
+
+
+_default_backend = None
+
+
+def get_default_backend() -> OcrBackend:
+    '''
+    Returns the backend used when none is given, creating it on first use
+    '''
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = create_backend()
+    return _default_backend
+
+
+def set_default_backend(backend: OcrBackend) -> None:
+    global _default_backend
+    _default_backend = backend
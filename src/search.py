@@ -2,7 +2,11 @@
 The search.py module implements the functionality for the word search
 '''
 
-from collections import namedtuple
+import mmap
+import os
+from array import array
+from collections import deque, namedtuple
+import tracing
 
 _DIRECTIONS = [
     (0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, -1), (-1, 1)
@@ -10,27 +14,525 @@ _DIRECTIONS = [
 
 FoundSearch = namedtuple('FoundSearch', ['r', 'c', 'dx', 'dy'])
 
+# a location where a word was found with up to a number of substituted letters, where
+# confidence is the mean OCR confidence of the substituted cells or None if it is unknown
+ApproximateSearch = namedtuple('ApproximateSearch', ['r', 'c', 'dx', 'dy', 'mismatches', 'confidence'])
+
+# checking the directions around one anchor cell takes about as long as scanning this many
+# cells of the line index, so words whose rarest letter is common in the grid are searched
+# with the line index instead
+_ANCHOR_COST = 256
+
+# key under which a trie node stores the word that ends at it
+_WORD_END = ''
+
+
+def build_trie(words: [str]) -> dict:
+    '''
+    Builds a trie of nested dictionaries from the given words, where
+    each node maps a character to its child node and the word ending
+    at a node is stored under the _WORD_END key
+    '''
+    trie = dict()
+    for word in words:
+        if len(word) == 0:
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, dict())
+        node[_WORD_END] = word
+    return trie
+
+
+class WordTrie:
+    '''
+    A trie of a large word list in uppercase for finding every word of
+    the list hidden in a grid, where the nodes of identical suffixes are
+    shared so the trie stays compact. Each node maps a character to its
+    child node and marks the end of a word with the _WORD_END key
+    '''
+    def __init__(self, words: [str], min_length=1) -> None:
+        root = dict()
+        count = 0
+        for word in words:
+            word = word.strip().upper()
+            if len(word) < max(min_length, 1):
+                continue
+            node = root
+            for char in word:
+                node = node.setdefault(char, dict())
+            if _WORD_END not in node:
+                node[_WORD_END] = True
+                count += 1
+        self._word_count = count
+        registry = dict()
+        self._root = self._share_suffixes(root, registry)
+        self._node_count = len(registry)
+
+    @classmethod
+    def from_file(cls, path: str, min_length=1, encoding='utf-8') -> 'WordTrie':
+        '''
+        Loads a word list with one word per line
+        '''
+        with open(path, encoding=encoding) as file:
+            return cls(file, min_length)
+
+    def _share_suffixes(self, node: dict, registry: dict) -> dict:
+        '''
+        Replaces the children of a node with the equal nodes seen before
+        and returns the registered node equal to it
+        '''
+        for char, child in node.items():
+            if char != _WORD_END:
+                node[char] = self._share_suffixes(child, registry)
+        # children are already shared, so equal nodes have the same children by identity
+        key = tuple(sorted((char, id(child) if char != _WORD_END else 0) for char, child in node.items()))
+        return registry.setdefault(key, node)
+
+    def __len__(self) -> int:
+        return self._word_count
+
+    def __contains__(self, word) -> bool:
+        node = self._root
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return False
+        return _WORD_END in node
+
+    def get_root(self) -> dict:
+        return self._root
+
+    def get_node_count(self) -> int:
+        return self._node_count
+
+
+def build_grid(lines: [str]) -> [[str]]:
+    '''
+    Builds the 2-D list of characters for the grid from the scanned lines
+    of the word search, reading the common '1' misread as an 'I'
+    '''
+    return [[char if char != '1' else 'I' for char in line] for line in lines]
+
+
+def changed_cells(old: [[str]], new: [[str]]) -> ({(int, int)} or None):
+    '''
+    Returns the set of (r, c) cells that differ between two grids
+    of the same shape, or None if the shape of the grid changed
+    '''
+    if len(old) != len(new) or any(len(old_row) != len(new_row) for old_row, new_row in zip(old, new)):
+        return None
+    return {(r, c) for r in range(len(new)) for c in range(len(new[r])) if old[r][c] != new[r][c]}
+
+
+def stream_search(path: str, words: [str], encoding='utf-8') -> 'Generator':
+    '''
+    Searches a grid stored as a text file with one row per line without loading
+    it into memory. The file is memory-mapped and only the rows within reach of
+    the current row are kept, and a (word, FoundSearch) tuple is yielded for every
+    location found, in the same order and with the same rule as search_all
+    '''
+    if os.path.getsize(path) == 0:
+        return
+    trie = build_trie(words)
+    reach = max((len(word) for word in words), default=1) - 1
+    window = deque()
+    first_row = 0
+    next_row = 0
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as grid:
+        for line in iter(grid.readline, b''):
+            window.append(line.rstrip(b'\r\n').decode(encoding))
+            # a row is searched once every row its words can reach below it is loaded
+            if first_row + len(window) - 1 - next_row >= reach:
+                yield from _stream_hits(trie, window, first_row, next_row)
+                next_row += 1
+                # drop the rows that no later row can reach
+                while first_row < next_row - reach:
+                    window.popleft()
+                    first_row += 1
+        while next_row < first_row + len(window):
+            yield from _stream_hits(trie, window, first_row, next_row)
+            next_row += 1
+
+
+def _stream_hits(trie: dict, window: deque, first_row: int, r: int) -> 'Generator':
+    '''
+    Yields a (word, FoundSearch) tuple for the words found from row r of
+    the grid, where window holds the loaded rows starting at first_row
+    '''
+    for _, c, dx, dy, word in _walk_trie(trie, window, (r,), first_row):
+        yield word, FoundSearch(r=r, c=c, dx=dx, dy=dy)
+
+
+def _walk_trie(trie: dict, rows, walk_rows, first_row=0, every_direction=False) -> 'Generator':
+    '''
+    Walks a trie from every cell of the rows in walk_rows in each direction, where
+    rows holds the rows of the grid from first_row on, and yields (r, c, dx, dy, word)
+    for every word found. The word is read from its trie node, or from the grid for
+    the shared nodes of a WordTrie. Unless every_direction is set, only the first
+    matching direction of each word is kept for each cell
+    '''
+    last_row = first_row + len(rows)
+    for r in walk_rows:
+        start_row = rows[r - first_row]
+        for c in range(len(start_row)):
+            if start_row[c] not in trie:
+                continue
+            found_here = set()
+            for dx, dy in _DIRECTIONS:
+                node = trie
+                row, col, length = r, c, 0
+                while first_row <= row < last_row:
+                    line = rows[row - first_row]
+                    if not 0 <= col < len(line):
+                        break
+                    node = node.get(line[col])
+                    if node is None:
+                        break
+                    length += 1
+                    word = node.get(_WORD_END)
+                    if word is not None:
+                        if word is True:
+                            word = ''.join(rows[r + i * dy - first_row][c + i * dx] for i in range(length))
+                        if every_direction or word not in found_here:
+                            found_here.add(word)
+                            yield r, c, dx, dy, word
+                    row, col = row + dy, col + dx
+
+
+class HitTable:
+    '''
+    Stores every found location of a set of words as compact columns of
+    r, c, dx and dy, with the hits of each word in one contiguous slice
+    '''
+    def __init__(self) -> None:
+        self._r = array('i')
+        self._c = array('i')
+        self._dx = array('b')
+        self._dy = array('b')
+        self._slices = dict()
+
+    def __len__(self) -> int:
+        return len(self._r)
+
+    def get_words(self) -> [str]:
+        return list(self._slices)
+
+    def count(self, word) -> int:
+        '''
+        Returns the number of hits of a word
+        '''
+        start, end = self._slices.get(word, (0, 0))
+        return end - start
+
+    def columns(self, word) -> (memoryview, memoryview, memoryview, memoryview):
+        '''
+        Returns views of the r, c, dx and dy columns for the hits of a
+        word without copying them
+        '''
+        start, end = self._slices.get(word, (0, 0))
+        return tuple(memoryview(column)[start:end] for column in (self._r, self._c, self._dx, self._dy))
+
+    def found(self, word) -> ([FoundSearch] or None):
+        '''
+        Builds the FoundSearch list for a word on demand, or returns None
+        if the word has no hits
+        '''
+        start, end = self._slices.get(word, (0, 0))
+        if start == end:
+            return None
+        return [FoundSearch(r=self._r[i], c=self._c[i], dx=self._dx[i], dy=self._dy[i]) for i in range(start, end)]
+
+    def _add_word(self, word, r: array, c: array, dx: array, dy: array) -> None:
+        '''
+        Appends the hit columns of a word to the table
+        '''
+        start = len(self._r)
+        self._r.extend(r)
+        self._c.extend(c)
+        self._dx.extend(dx)
+        self._dy.extend(dy)
+        self._slices[word] = start, len(self._r)
+
+
 class Searcher:
     def __init__(self, contents: [[str]]) -> None:
         self._contents = contents
+        self._lines = None
+        self._positions = None
+
+    def get_contents(self) -> [[str]]:
+        return self._contents
 
     def search(self, word) -> ([FoundSearch] or None):
         '''
         Searches for a word in the grid and returns the
         coordinates and direction of the found location
         '''
+        if len(word) == 0:
+            return
+        tracing.count('words_searched')
+        # the first matching direction of each start cell is kept
+        found_directions = dict()
+        with tracing.span('search'):
+            positions = self._letter_index()
+            anchor = min(range(len(word)), key=lambda ind: len(positions.get(word[ind], ())))
+            anchors = positions.get(word[anchor], ())
+            if len(anchors) * _ANCHOR_COST < self._cell_count():
+                self._search_anchored(word, anchor, anchors, found_directions)
+            else:
+                self._search_lines(word, found_directions)
         finds = []
+        for start in sorted(found_directions):
+            dx, dy = _DIRECTIONS[found_directions[start]]
+            finds.append(FoundSearch(r=start[0], c=start[1], dx=dx, dy=dy))
+        return finds if len(finds) > 0 else None
+
+    def _search_anchored(self, word, anchor: int, anchors: [(int, int)], found_directions: dict) -> None:
+        '''
+        Finds a word by checking each direction around every cell of its
+        rarest letter, which sits at the offset anchor inside the word
+        '''
+        contents = self._contents
+        last = len(word) - 1
+        for r, c in anchors:
+            for index, (dx, dy) in enumerate(_DIRECTIONS):
+                start_r, start_c = r - anchor * dy, c - anchor * dx
+                # both ends must be inside the grid before the letters are compared
+                if not (0 <= start_r < len(contents) and 0 <= start_r + last * dy < len(contents)) or \
+                        start_c < 0 or start_c + last * dx < 0:
+                    continue
+                start = start_r, start_c
+                if index < found_directions.get(start, len(_DIRECTIONS)) and \
+                        self._search_direction(0, start_r, start_c, word, dx, dy):
+                    found_directions[start] = index
+
+    def _search_lines(self, word, found_directions: dict) -> None:
+        '''
+        Finds a word by scanning the cached lines of the grid in every direction
+        '''
+        for line, r, c, index in self._line_index():
+            offset = line.find(word)
+            while offset != -1:
+                start = self._line_position(r, c, index, offset)
+                if index < found_directions.get(start, len(_DIRECTIONS)):
+                    found_directions[start] = index
+                offset = line.find(word, offset + 1)
+
+    def search_all(self, words: [str], rows=None) -> {str: [FoundSearch] or None}:
+        '''
+        Searches for every word in the word bank with a single walk
+        over the grid and returns a dictionary of each word to its
+        found locations, or None if the word is not in the grid.
+        If rows is given, only words starting in those rows are found
+        '''
+        with tracing.span('search_all', words=len(words)):
+            return self._search_all(words, rows)
+
+    def _search_all(self, words: [str], rows=None) -> {str: [FoundSearch] or None}:
+        trie = build_trie(words)
+        finds = {word: [] for word in words}
+        contents = self._contents
+        walk_rows = rows if rows is not None else range(len(contents))
+        for r, c, dx, dy, word in _walk_trie(trie, contents, walk_rows):
+            finds[word].append(FoundSearch(r=r, c=c, dx=dx, dy=dy))
+        if tracing.is_enabled():
+            tracing.count('words_searched', len(finds))
+            tracing.count('cells_visited', sum(len(row) for row in contents))
+            tracing.count('start_cells', sum(char in trie for r in walk_rows for char in contents[r]))
+        return {word: found if len(found) > 0 else None for word, found in finds.items()}
+
+    def discover(self, trie: WordTrie, min_length=3) -> {str: [FoundSearch]}:
+        '''
+        Finds every word of a word list trie of at least min_length letters
+        hidden in the grid in any direction, returning a dictionary of each
+        word found to its locations. A walk stops as soon as no word of the
+        trie starts with the letters read so far
+        '''
+        with tracing.span('discover', words=len(trie)):
+            finds = dict()
+            for r, c, dx, dy, word in _walk_trie(trie.get_root(), self._contents, range(len(self._contents))):
+                if len(word) >= min_length:
+                    finds.setdefault(word, []).append(FoundSearch(r=r, c=c, dx=dx, dy=dy))
+            tracing.count('words_discovered', len(finds))
+        return finds
+
+    def search_approximate(self, words: [str], max_mismatches=1, confidence=None) \
+            -> {str: [ApproximateSearch] or None}:
+        '''
+        Searches for every word in the word bank allowing up to max_mismatches
+        substituted letters, such as letters misread by OCR, and returns a
+        dictionary of each word to its locations ranked from the best match.
+        Fewer mismatches rank first, then mismatches in cells with a lower
+        confidence, given as a 2-D list of the OCR confidence of each cell
+        '''
+        with tracing.span('search_approximate', words=len(words)):
+            return self._search_approximate(words, max_mismatches, confidence)
+
+    def _search_approximate(self, words: [str], max_mismatches: int, confidence) \
+            -> {str: [ApproximateSearch] or None}:
+        finds = {word: [] for word in words}
+        # words no longer than the mismatches allowed would match anywhere
+        bank = [word for word in dict.fromkeys(words) if len(word) > max_mismatches]
+        if len(bank) == 0:
+            return {word: None for word in words}
+
+        # every word takes one bit per letter of a single integer, so one Shift-And pass
+        # over a line matches the whole bank, and the shift of a word's last bit into the
+        # next word's first bit is harmless because first bits are always set
+        masks = dict()
+        starts = 0
+        ends = 0
+        end_words = dict()
+        bit = 0
+        for word in bank:
+            starts |= 1 << bit
+            for ind, char in enumerate(word):
+                masks[char] = masks.get(char, 0) | 1 << (bit + ind)
+            bit += len(word)
+            ends |= 1 << (bit - 1)
+            end_words[bit - 1] = word
+        full = (1 << bit) - 1
+
+        for line, r, c, index in self._line_index():
+            # states[j] has the bit of each word prefix that ends here with at most j mismatches
+            states = [0] * (max_mismatches + 1)
+            for offset, char in enumerate(line):
+                mask = masks.get(char, 0)
+                substituted = 0
+                for j in range(len(states)):
+                    shifted = ((states[j] << 1) | starts) & full
+                    states[j] = (shifted & mask) | substituted
+                    substituted = shifted
+                matched = states[-1] & ends
+                while matched:
+                    low = matched & -matched
+                    matched ^= low
+                    word = end_words[low.bit_length() - 1]
+                    finds[word].append(self._approximate_hit(word, line, r, c, index,
+                                                             offset - len(word) + 1, confidence))
+
+        ranked = dict()
+        for word, found in finds.items():
+            found.sort(key=lambda fs: (fs.mismatches, fs.confidence or 0.0, fs.r, fs.c,
+                                       _DIRECTIONS.index((fs.dx, fs.dy))))
+            ranked[word] = found if len(found) > 0 else None
+        return ranked
+
+    def _approximate_hit(self, word, line: str, r: int, c: int, index: int, offset: int, confidence) \
+            -> ApproximateSearch:
+        '''
+        Creates the approximate match of a word starting at an offset into
+        the line starting at (r, c) in the direction at the given index
+        '''
+        dx, dy = _DIRECTIONS[index]
+        start_r, start_c = self._line_position(r, c, index, offset)
+        mismatched = [(start_r + ind * dy, start_c + ind * dx)
+                      for ind, char in enumerate(word) if line[offset + ind] != char]
+        mean_confidence = None
+        if confidence is not None and len(mismatched) > 0:
+            mean_confidence = sum(confidence[row][col] for row, col in mismatched) / len(mismatched)
+        return ApproximateSearch(r=start_r, c=start_c, dx=dx, dy=dy,
+                                 mismatches=len(mismatched), confidence=mean_confidence)
+
+    def search_every(self, words: [str]) -> HitTable:
+        '''
+        Searches for every word in the word bank and returns a HitTable
+        with every matching direction from each cell, not only the first
+        '''
+        trie = build_trie(words)
+        columns = {word: (array('i'), array('i'), array('b'), array('b')) for word in words}
+        contents = self._contents
+        for r, c, dx, dy, word in _walk_trie(trie, contents, range(len(contents)), every_direction=True):
+            rs, cs, dxs, dys = columns[word]
+            rs.append(r)
+            cs.append(c)
+            dxs.append(dx)
+            dys.append(dy)
+        table = HitTable()
+        for word, (rs, cs, dxs, dys) in columns.items():
+            table._add_word(word, rs, cs, dxs, dys)
+        return table
+
+    def research(self, word, previous: [FoundSearch] or None, changed: {(int, int)}) -> ([FoundSearch] or None):
+        '''
+        Updates the found locations of a word after the cells in changed
+        were edited, searching again only the start cells whose lines
+        pass through an edited cell and keeping every other location
+        '''
         if len(word) == 0:
             return
-        for r in range(len(self._contents)):
-            for c in range(len(self._contents[r])):
-                if self._contents[r][c] == word[0]:
-                    result = self._search_at_location(r, c, word)
-                    if result:
-                        dx, dy = result
-                        finds.append(FoundSearch(r=r, c=c, dx=dx, dy=dy))
+        affected = set()
+        for r, c in changed:
+            for dx, dy in _DIRECTIONS:
+                for ind in range(len(word)):
+                    affected.add((r - ind * dy, c - ind * dx))
+        if len(affected) >= sum(len(row) for row in self._contents):
+            # most of the grid was edited, so a full search is cheaper
+            return self.search(word)
+        finds = [fs for fs in previous or [] if (fs.r, fs.c) not in affected]
+        for r, c in affected:
+            if 0 <= r < len(self._contents) and 0 <= c < len(self._contents[r]):
+                result = self._search_at_location(r, c, word)
+                if result:
+                    dx, dy = result
+                    finds.append(FoundSearch(r=r, c=c, dx=dx, dy=dy))
+        finds.sort(key=lambda fs: (fs.r, fs.c))
         return finds if len(finds) > 0 else None
 
+    def _letter_index(self) -> {str: [(int, int)]}:
+        '''
+        Builds a map of each letter to the cells that hold it once and
+        caches it, with the cells of each letter in row-major order
+        '''
+        if self._positions is None:
+            with tracing.span('letter_index'):
+                positions = dict()
+                for r, row in enumerate(self._contents):
+                    for c, char in enumerate(row):
+                        positions.setdefault(char, []).append((r, c))
+                self._positions = positions
+        return self._positions
+
+    def _cell_count(self) -> int:
+        return sum(len(row) for row in self._contents)
+
+    def _line_index(self) -> [(str, int, int, int)]:
+        '''
+        Builds the lines of the grid in every direction once and caches them,
+        each as a tuple of (line, r, c, direction index) from its first cell
+        '''
+        if self._lines is None:
+            with tracing.span('line_index'):
+                self._lines = self._build_lines()
+        return self._lines
+
+    def _build_lines(self) -> [(str, int, int, int)]:
+        contents = self._contents
+        lines = []
+        for index, (dx, dy) in enumerate(_DIRECTIONS):
+            for r in range(len(contents)):
+                for c in range(len(contents[r])):
+                    # a line starts at a cell with no cell before it
+                    prev_r, prev_c = r - dy, c - dx
+                    if 0 <= prev_r < len(contents) and 0 <= prev_c < len(contents[prev_r]):
+                        continue
+                    chars = []
+                    row, col = r, c
+                    while 0 <= row < len(contents) and 0 <= col < len(contents[row]):
+                        chars.append(contents[row][col])
+                        row, col = row + dy, col + dx
+                    lines.append((''.join(chars), r, c, index))
+        return lines
+
+    def _line_position(self, r: int, c: int, index: int, offset: int) -> (int, int):
+        '''
+        Maps an offset into the line starting at (r, c) in the direction
+        at the given index back to its coordinates in the grid
+        '''
+        dx, dy = _DIRECTIONS[index]
+        return r + offset * dy, c + offset * dx
+
     def _search_at_location(self, r, c, word) -> (int, int):
         '''
         Searches for a word in every direction within a coordinate
@@ -42,16 +544,15 @@ class Searcher:
 
     def _search_direction(self, ind: int, r: int, c: int, word: str, dx: int, dy: int) -> bool:
         '''
-        Recursively searches for a word in a given direction
+        Searches for a word in a given direction, one character at a time
         '''
-        # print(f'ind: {ind} r, c: {(r, c)}, word: {word}, dx, dy: {dx, dy}')
-        if (r < 0 or c < 0) or \
-                (r >= len(self._contents)) or (c >= len(self._contents[r])) or \
-                ind == len(word) or word[ind] != self._contents[r][c]:  # out of range
-            return False
-        if ind == len(word) - 1 and word[ind] == self._contents[r][c]:  # reached end (base case)
-            return True
-        return True and self._search_direction(ind + 1, r + dy, c + dx, word, dx, dy)
+        while ind < len(word):
+            if (r < 0 or c < 0) or \
+                    (r >= len(self._contents)) or (c >= len(self._contents[r])) or \
+                    word[ind] != self._contents[r][c]:  # out of range
+                return False
+            ind, r, c = ind + 1, r + dy, c + dx
+        return ind > 0
 
 
 if __name__ == '__main__':
@@ -0,0 +1,458 @@
+'''
+The service.py module implements a long-running local solver service,
+which keeps OCR loaded and the searchers of recent grids warm between
+requests, and a client for it. Requests are JSON over HTTP on a local
+port or a Unix socket, and concurrent requests are solved in small batches
+'''
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import search
+import tracing
+
+_DEFAULT_ADDRESS = '127.0.0.1:8765'
+_MAX_BODY_BYTES = 16 * 1024 * 1024
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+def _parse_address(address: str) -> (str, str or int):
+    '''
+    Splits an address given as "host:port" or "unix:/path/to/socket"
+    into its family and location
+    '''
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def _as_dicts(found) -> ([dict] or None):
+    return [fs._asdict() for fs in found] if found else None
+
+
+def _is_strings(value) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _check_request(target: str, request) -> None:
+    '''
+    Raises a ValueError if a request does not have the fields its endpoint needs
+    '''
+    if not isinstance(request, dict):
+        raise ValueError('The request must be a JSON object')
+    max_mismatches = request.get('max_mismatches', 0)
+    if not isinstance(max_mismatches, int) or isinstance(max_mismatches, bool) or max_mismatches < 0:
+        raise ValueError('max_mismatches must be a non-negative integer')
+    if target == '/solve' and request.get('grid') is not None:
+        if not _is_strings(request['grid']) or not _is_strings(request.get('words', [])):
+            raise ValueError('grid and words must be lists of strings')
+        return
+    if not isinstance(request.get('image'), str):
+        raise ValueError('image must be the path of an image')
+    if target == '/scan':
+        region = request.get('region')
+        if not isinstance(region, list) or len(region) != 4 or \
+                not all(isinstance(value, (int, float)) for value in region):
+            raise ValueError('region must be the corners x1, y1, x2, y2 in pixels')
+        if request.get('config', 'wordbank') not in ('wordsearch', 'wordbank'):
+            raise ValueError('config must be wordsearch or wordbank')
+
+
+class SolverService:
+    '''
+    Solves grids and scanned images sent by clients. Requests that arrive
+    within batch_window seconds of each other are handled as one batch,
+    where requests for the same grid share a single search and images are
+    scanned in parallel by the warm OCR backend
+    '''
+    def __init__(self, workers=None, ocr_workers=None, max_jobs=200, batch_window=0.005, max_batch=64,
+                 max_searchers=32, max_images=8, use_cache=True):
+        self._workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self._workers)
+        self._ocr_workers = ocr_workers
+        self._max_jobs = max_jobs
+        self._batch_window = batch_window
+        self._max_batch = max_batch
+        self._max_searchers = max_searchers
+        self._use_cache = use_cache
+        # searchers of recent grids, least recently used first
+        self._searchers = OrderedDict()
+        self._searchers_lock = threading.Lock()
+        # decoded images of recent scans by path and modification time, least recently used first
+        self._max_images = max_images
+        self._images = OrderedDict()
+        self._images_lock = threading.Lock()
+        self._queue = None
+        self._started = time.time()
+        self._requests = 0
+        self._batches = 0
+
+    def warm_up(self) -> None:
+        '''
+        Imports the imaging modules and loads the OCR backend in every
+        thread of the pool, since tesserocr keeps one api per thread, so
+        the first requests do not pay for it
+        '''
+        import batch
+        import imaging
+        import numpy as np
+        import ocr
+        if self._ocr_workers:
+            ocr.set_default_backend(ocr.create_backend(self._ocr_workers, self._max_jobs))
+        blank = np.full((32, 32, 3), 255, np.uint8)
+        # each thread waits for the others, so every thread of the pool runs one warm up
+        barrier = threading.Barrier(self._workers)
+
+        def warm_thread() -> None:
+            try:
+                for config in (imaging.WORDSEARCH_CONFIG, imaging.WORDBANK_CONFIG):
+                    ocr.get_default_backend().image_to_data(blank, config)
+            finally:
+                barrier.wait()
+
+        for future in [self._executor.submit(warm_thread) for _ in range(self._workers)]:
+            try:
+                future.result()
+            except Exception as e:
+                print(e)
+
+    async def serve(self, address=_DEFAULT_ADDRESS) -> None:
+        '''
+        Listens on the address until the task is cancelled
+        '''
+        self._queue = asyncio.Queue()
+        batcher = asyncio.ensure_future(self._batcher())
+        family, location = _parse_address(address)
+        if family == 'unix':
+            # only a socket left by an earlier run is removed, never a file at a mistyped path
+            if os.path.exists(location) and stat.S_ISSOCK(os.stat(location).st_mode):
+                os.remove(location)
+            server = await asyncio.start_unix_server(self._handle, path=location)
+        else:
+            server = await asyncio.start_server(self._handle, host=family, port=location)
+        print(f'Solver service listening on {address}', file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(wait=False)
+
+    async def _handle(self, reader, writer) -> None:
+        '''
+        Reads one HTTP request from a connection and writes its JSON response
+        '''
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = dict()
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length > _MAX_BODY_BYTES:
+                status, payload = 413, {'error': f'Request is larger than {_MAX_BODY_BYTES} bytes'}
+            else:
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self._route(method, target, body)
+        except Exception as e:
+            status, payload = 400, {'error': str(e)}
+        data = json.dumps(payload).encode()
+        writer.write(f'HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode() + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, target: str, body: bytes) -> (int, dict):
+        '''
+        Queues a request for the next batch and waits for its result
+        '''
+        if method == 'GET' and target == '/stats':
+            return 200, self.stats()
+        if method != 'POST' or target not in ('/solve', '/scan'):
+            return 404, {'error': f'No endpoint {method} {target}'}
+        try:
+            request = json.loads(body or b'{}')
+            _check_request(target, request)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        self._requests += 1
+        result = asyncio.get_running_loop().create_future()
+        await self._queue.put((target, request, result))
+        try:
+            return 200, await result
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+    async def _batcher(self) -> None:
+        '''
+        Collects the requests that arrive within the batch window of the
+        first one and dispatches them together
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._batch_window
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._batches += 1
+            tracing.count('service_batches')
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                # a failed batch answers its own requests with the error and the service carries on
+                for _, _, result in batch:
+                    if not result.done():
+                        result.set_exception(e)
+
+    def _dispatch(self, batch: [(str, dict, 'Future')]) -> None:
+        '''
+        Runs a batch on the thread pool, grouping the grid requests by
+        grid so each grid is searched once for the words of every request
+        '''
+        groups = dict()
+        for target, request, result in batch:
+            if target == '/solve' and request.get('grid') is not None:
+                grid = tuple(''.join(row) for row in search.build_grid(request['grid']))
+                key = grid, request.get('max_mismatches', 0)
+                groups.setdefault(key, []).append((request, result))
+            elif target == '/solve':
+                self._run([result], self._solve_image, request)
+            else:
+                self._run([result], self._scan, request)
+        for (grid, max_mismatches), requests in groups.items():
+            self._run([result for _, result in requests], self._solve_grid, grid, max_mismatches,
+                      [request for request, _ in requests])
+
+    def _run(self, results: ['Future'], function, *args) -> None:
+        '''
+        Calls a function on the thread pool and sets the futures of its
+        requests to its results, or to its error if it fails
+        '''
+        def finish(future) -> None:
+            try:
+                values = future.result()
+            except Exception as e:
+                for result in results:
+                    if not result.done():
+                        result.set_exception(e)
+                return
+            if len(results) == 1 and not isinstance(values, list):
+                values = [values]
+            for result, value in zip(results, values):
+                if not result.done():
+                    result.set_result(value)
+
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(self._executor, function, *args).add_done_callback(finish)
+
+    def _get_searcher(self, grid: (str,)) -> search.Searcher:
+        '''
+        Returns the searcher of a grid, keeping the most recent ones with their indexes
+        '''
+        with self._searchers_lock:
+            searcher = self._searchers.get(grid)
+            if searcher is not None:
+                self._searchers.move_to_end(grid)
+                tracing.count('service_searcher_hits')
+                return searcher
+        searcher = search.Searcher([list(row) for row in grid])
+        with self._searchers_lock:
+            self._searchers[grid] = searcher
+            while len(self._searchers) > self._max_searchers:
+                self._searchers.popitem(last=False)
+        return searcher
+
+    def _get_image(self, path: str) -> 'Imaging':
+        '''
+        Returns the image at a path, keeping the most recent ones decoded
+        so the scans of one puzzle share a single decode
+        '''
+        import imaging
+        key = path, os.path.getmtime(path)
+        with self._images_lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                tracing.count('service_image_hits')
+                return image
+        image = imaging.Imaging(path)
+        with self._images_lock:
+            image = self._images.setdefault(key, image)
+            while len(self._images) > self._max_images:
+                self._images.popitem(last=False)
+        return image
+
+    def _solve_grid(self, grid: (str,), max_mismatches: int, requests: [dict]) -> [dict]:
+        '''
+        Searches a grid once for the words of every request for it
+        '''
+        searcher = self._get_searcher(grid)
+        words = list(dict.fromkeys(word.upper() for request in requests for word in request.get('words', [])))
+        answers = searcher.search_all(words)
+        approximate = dict()
+        if max_mismatches > 0:
+            approximate = searcher.search_approximate([word for word in words if answers[word] is None],
+                                                      max_mismatches)
+        results = []
+        for request in requests:
+            bank = [word.upper() for word in request.get('words', [])]
+            result = {'grid': list(grid), 'words': {word: _as_dicts(answers[word]) for word in bank}}
+            if max_mismatches > 0:
+                result['approximate'] = {word: _as_dicts(approximate[word]) for word in bank if word in approximate}
+            results.append(result)
+        return results
+
+    def _solve_image(self, request: dict) -> dict:
+        '''
+        Scans and solves an image the same way as the batch solver
+        '''
+        import batch
+        return batch.solve_image(
+            request['image'], request.get('wordsearch'), request.get('wordbank'),
+            use_cache=self._use_cache and request.get('use_cache', True),
+            max_mismatches=request.get('max_mismatches', 0),
+            dictionary=request.get('dictionary'), min_length=request.get('min_length', 4),
+            auto=request.get('auto', False))
+
+    def _scan(self, request: dict) -> dict:
+        '''
+        Scans a selection of an image in pixels and returns its text data
+        '''
+        import cache
+        import imaging
+        configs = {'wordsearch': imaging.WORDSEARCH_CONFIG, 'wordbank': imaging.WORDBANK_CONFIG}
+        x1, y1, x2, y2 = request['region']
+        text_data = self._get_image(request['image']).process_selection(
+            (x1, y1), (x2, y2), config=configs[request.get('config', 'wordbank')],
+            cache=cache.get_default_cache() if self._use_cache else None)
+        return {'text_data': [vars(data) for data in text_data]}
+
+    def stats(self) -> dict:
+        with self._searchers_lock:
+            searchers = len(self._searchers)
+        return {'uptime': time.time() - self._started, 'requests': self._requests, 'batches': self._batches,
+                'searchers': searchers}
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class SolverClient:
+    '''
+    Sends requests to a running solver service
+    '''
+    def __init__(self, address=_DEFAULT_ADDRESS, timeout=300):
+        self._address = address
+        self._timeout = timeout
+
+    def _request(self, method: str, path: str, payload=None) -> dict:
+        family, location = _parse_address(self._address)
+        if family == 'unix':
+            connection = _UnixConnection(location, timeout=self._timeout)
+        else:
+            connection = http.client.HTTPConnection(family, location, timeout=self._timeout)
+        try:
+            body = json.dumps(payload).encode() if payload is not None else None
+            connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            result = json.loads(response.read())
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(result.get('error', response.reason))
+        return result
+
+    def solve_grid(self, grid: [[str]] or [str], words: [str], max_mismatches=0) -> dict:
+        '''
+        Solves a grid for the words of a word bank
+        '''
+        return self._request('POST', '/solve', {'grid': [''.join(row) for row in grid], 'words': list(words),
+                                                'max_mismatches': max_mismatches})
+
+    def solve_image(self, path: str, wordsearch_region=None, wordbank_region=None, use_cache=True, max_mismatches=0,
+                    dictionary=None, min_length=4, auto=False) -> dict:
+        '''
+        Scans and solves the regions of an image, given in pixels or as
+        fractions of the image size or detected in auto mode, and returns
+        the same result as batch.solve_image
+        '''
+        return self._request('POST', '/solve', {
+            'image': os.path.abspath(path), 'auto': auto,
+            'wordsearch': list(wordsearch_region) if wordsearch_region is not None else None,
+            'wordbank': list(wordbank_region) if wordbank_region is not None else None,
+            'use_cache': use_cache, 'max_mismatches': max_mismatches,
+            'dictionary': os.path.abspath(dictionary) if dictionary else None, 'min_length': min_length})
+
+    def scan(self, path: str, coord1, coord2, config='wordbank') -> [dict]:
+        '''
+        Scans a selection of an image between two corners in pixels with
+        the wordsearch or wordbank config and returns its text data
+        '''
+        return self._request('POST', '/scan', {'image': os.path.abspath(path), 'region': [*coord1, *coord2],
+                                               'config': config})['text_data']
+
+    def stats(self) -> dict:
+        return self._request('GET', '/stats')
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Run the word search solver as a local service.')
+    parser.add_argument('--address', default=_DEFAULT_ADDRESS,
+                        help=f'host:port or unix:/path/to/socket to listen on (default: {_DEFAULT_ADDRESS})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of threads solving requests (default: number of CPUs)')
+    parser.add_argument('--ocr-workers', type=int, default=None,
+                        help='number of processes keeping tesseract loaded, when tesserocr is installed')
+    parser.add_argument('--max-jobs', type=int, default=200,
+                        help='number of scans an OCR process handles before it is replaced')
+    parser.add_argument('--batch-window', type=float, default=5.0,
+                        help='milliseconds to wait for more requests to batch with the first one')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='scan every image again instead of reusing cached OCR results')
+    parser.add_argument('--trace', help='record the time of each stage to this JSON or .trace file')
+    args = parser.parse_args(argv)
+    if args.trace:
+        tracing.enable(args.trace)
+    service = SolverService(workers=args.workers, ocr_workers=args.ocr_workers, max_jobs=args.max_jobs,
+                            batch_window=args.batch_window / 1000, use_cache=not args.no_cache)
+    service.warm_up()
+    try:
+        asyncio.run(service.serve(args.address))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+'''
+The session.py module implements session files, which store a solved
+puzzle with a reduced copy of its image, the scanned text data, the grid,
+the selections and the solutions, so the puzzle can be reopened without
+decoding the original image or scanning it again
+'''
+
+import io
+import json
+import zipfile
+import search
+from PIL import Image
+
+SESSION_VERSION = 1
+_MANIFEST = 'session.json'
+_PREVIEW = 'preview.jpg'
+# longest side of the stored copy of the image
+_PREVIEW_SIZE = 2000
+
+
+def _found_to_json(answers: {str: [tuple] or None}) -> {str: [dict] or None}:
+    return {word: [fs._asdict() for fs in found] if found else None for word, found in answers.items()}
+
+
+def _found_from_json(answers: {str: [dict] or None}, kind) -> {str: [tuple] or None}:
+    return {word: [kind(**fs) for fs in found] if found else None for word, found in answers.items()}
+
+
+class Session:
+    '''
+    A solved puzzle as it is saved in a session file. Regions are the
+    corners of the selections in pixels of the original image, and the
+    text data of each selection is kept as dictionaries. A session also
+    stands in for the image of the puzzle, so a session read from a file
+    only decodes its preview once it is displayed
+    '''
+    def __init__(self, image_path: str, image_size: (int, int), wordsearch_region, wordbank_region,
+                 wordsearch_data: [dict], wordbank_data: [dict], grid: [[str]], wordbank: [str],
+                 answers: {str: [search.FoundSearch] or None}, approximate=None, preview=None):
+        self._image_path = image_path
+        self._image_size = tuple(image_size)
+        self._wordsearch_region = tuple(wordsearch_region)
+        self._wordbank_region = tuple(wordbank_region)
+        self._wordsearch_data = wordsearch_data
+        self._wordbank_data = wordbank_data
+        self._grid = [list(row) for row in grid]
+        self._wordbank = list(wordbank)
+        self._answers = answers
+        self._approximate = approximate or dict()
+        self._preview = preview
+        # the session file the preview is read from when it is first needed
+        self._file = None
+
+    @classmethod
+    def load(cls, path: str) -> 'Session':
+        '''
+        Reads a session file, leaving its preview undecoded until it is needed
+        '''
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read(_MANIFEST))
+        if manifest.get('version', 0) > SESSION_VERSION:
+            raise ValueError(f'Session version {manifest.get("version")} is newer than the supported '
+                             f'version {SESSION_VERSION}')
+        image = manifest['image']
+        loaded = cls(image['path'], (image['width'], image['height']),
+                     manifest['wordsearch']['region'], manifest['wordbank']['region'],
+                     manifest['wordsearch']['text_data'], manifest['wordbank']['text_data'],
+                     manifest['grid'], manifest['wordbank_content'],
+                     _found_from_json(manifest['answers'], search.FoundSearch),
+                     _found_from_json(manifest.get('approximate', dict()), search.ApproximateSearch))
+        loaded._file = path
+        return loaded
+
+    def save(self, path: str) -> None:
+        '''
+        Writes the session to a file, storing the preview as a JPEG of at
+        most _PREVIEW_SIZE pixels on its longest side
+        '''
+        manifest = {
+            'version': SESSION_VERSION,
+            'image': {'path': self._image_path, 'width': self._image_size[0], 'height': self._image_size[1]},
+            'wordsearch': {'region': self._wordsearch_region, 'text_data': self._wordsearch_data},
+            'wordbank': {'region': self._wordbank_region, 'text_data': self._wordbank_data},
+            'grid': [''.join(row) for row in self._grid],
+            'wordbank_content': self._wordbank,
+            'answers': _found_to_json(self._answers),
+            'approximate': _found_to_json(self._approximate),
+        }
+        preview = Image.fromarray(self.get_image())
+        preview.thumbnail((_PREVIEW_SIZE, _PREVIEW_SIZE))
+        encoded = io.BytesIO()
+        preview.save(encoded, format='JPEG', quality=90)
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr(_MANIFEST, json.dumps(manifest), compress_type=zipfile.ZIP_DEFLATED)
+            # the JPEG is already compressed
+            archive.writestr(_PREVIEW, encoded.getvalue(), compress_type=zipfile.ZIP_STORED)
+
+    def get_image(self) -> 'Image':
+        '''
+        Returns the preview of the image as an RGB array, decoding it from
+        the session file on first use
+        '''
+        if self._preview is None:
+            import numpy as np
+            with zipfile.ZipFile(self._file) as archive, Image.open(io.BytesIO(archive.read(_PREVIEW))) as preview:
+                self._preview = np.asarray(preview.convert('RGB'))
+        return self._preview
+
+    def get_image_dimensions(self) -> (int, int):
+        '''
+        Returns the dimensions of the original image, which the regions
+        and text data are measured in
+        '''
+        return self._image_size
+
+    def get_path(self) -> str:
+        return self._image_path
+
+    def get_wordsearch_region(self) -> (int, int, int, int):
+        return self._wordsearch_region
+
+    def get_wordbank_region(self) -> (int, int, int, int):
+        return self._wordbank_region
+
+    def get_wordsearch_data(self) -> [dict]:
+        return self._wordsearch_data
+
+    def get_wordbank_data(self) -> [dict]:
+        return self._wordbank_data
+
+    def get_grid(self) -> [[str]]:
+        return self._grid
+
+    def get_wordbank(self) -> [str]:
+        return self._wordbank
+
+    def get_answers(self) -> {str: [search.FoundSearch] or None}:
+        return self._answers
+
+    def get_approximate(self) -> {str: [search.ApproximateSearch] or None}:
+        return self._approximate
@@ -0,0 +1,84 @@
+'''
+The sharded.py module implements a parallel search of large grids, which
+are split into bands of rows searched in a pool of processes that share
+the grid through shared memory
+'''
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import search
+from search import FoundSearch
+
+# every cell is stored as one UTF-32 code point, with 0 padding the end of shorter rows
+_CELL_BYTES = 4
+
+
+def _read_rows(buffer, width: int, lengths: [int], start: int, end: int) -> [str]:
+    '''
+    Decodes the rows from start to end of a grid stored in a shared buffer
+    '''
+    rows = []
+    for r in range(start, end):
+        offset = r * width * _CELL_BYTES
+        rows.append(bytes(buffer[offset:offset + lengths[r] * _CELL_BYTES]).decode('utf-32-le'))
+    return rows
+
+
+def _search_band(name: str, width: int, lengths: [int], words: [str], start: int, end: int, reach: int) \
+        -> {str: [(int, int, int, int)]}:
+    '''
+    Searches for the words starting in rows start to end of the shared grid,
+    loading the rows within reach of the band so words can cross into them
+    '''
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        first_row = max(0, start - reach)
+        rows = _read_rows(memory.buf, width, lengths, first_row, min(len(lengths), end + reach))
+    finally:
+        memory.close()
+    answers = search.Searcher(rows).search_all(words, rows=range(start - first_row, end - first_row))
+    return {word: [(fs.r + first_row, fs.c, fs.dx, fs.dy) for fs in found]
+            for word, found in answers.items() if found}
+
+
+def search_sharded(contents: [[str]], words: [str], workers=None, band_rows=None) \
+        -> {str: [FoundSearch] or None}:
+    '''
+    Searches for every word in the word bank across a pool of processes and
+    returns the same dictionary as Searcher.search_all. Each process searches
+    the words starting in its band of rows, reading the rows around it from
+    a copy of the grid in shared memory, so no hit is found twice
+    '''
+    workers = workers or os.cpu_count() or 1
+    height = len(contents)
+    if workers == 1 or height < 2:
+        return search.Searcher(contents).search_all(words)
+
+    width = max(len(row) for row in contents)
+    lengths = [len(row) for row in contents]
+    reach = max((len(word) for word in words), default=1) - 1
+    # a few bands per worker keeps the pool busy when bands take unequal time
+    band_rows = band_rows or max(1, math.ceil(height / (workers * 4)))
+
+    memory = shared_memory.SharedMemory(create=True, size=max(1, height * width * _CELL_BYTES))
+    try:
+        for r, row in enumerate(contents):
+            data = ''.join(row).encode('utf-32-le')
+            offset = r * width * _CELL_BYTES
+            memory.buf[offset:offset + len(data)] = data
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_search_band, memory.name, width, lengths, words,
+                                       start, min(height, start + band_rows), reach)
+                       for start in range(0, height, band_rows)]
+            # bands are merged in order so every word keeps its hits in row-major order
+            finds = {word: [] for word in words}
+            for future in futures:
+                for word, found in future.result().items():
+                    finds[word].extend(FoundSearch(*hit) for hit in found)
+    finally:
+        memory.close()
+        memory.unlink()
+    return {word: found if len(found) > 0 else None for word, found in finds.items()}
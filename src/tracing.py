@@ -0,0 +1,179 @@
+'''
+The tracing.py module implements optional timing spans and counters for
+the stages of the solver, which can be exported as JSON or as a Chrome
+trace. Tracing is enabled by setting WSVISION_TRACE to the output file,
+where {pid} is replaced by the process id, or by calling enable(), and
+costs almost nothing while it is disabled
+'''
+
+import atexit
+import functools
+import os
+import threading
+import time
+
+_enabled = False
+_output = None
+_save_registered = False
+_lock = threading.Lock()
+_spans = []
+_counters = dict()
+_start = time.perf_counter()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name: str, args: dict):
+        self._name = name
+        self._args = args
+
+    def __enter__(self):
+        self._begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        with _lock:
+            _spans.append((self._name, self._begin - _start, end - self._begin,
+                           threading.get_ident(), self._args))
+        return False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(output=None) -> None:
+    '''
+    Starts recording spans and counters, saving them to output when the
+    program exits if a path is given
+    '''
+    global _enabled, _output, _save_registered
+    _enabled = True
+    _output = output
+    if output and not _save_registered:
+        # multiprocessing and json are only imported when needed so importing the solver stays cheap
+        import multiprocessing
+        if multiprocessing.parent_process() is not None:
+            # worker processes skip atexit handlers but run multiprocessing finalizers
+            from multiprocessing import util
+            util.Finalize(None, _save_output, exitpriority=10)
+        else:
+            atexit.register(_save_output)
+        _save_registered = True
+
+
+def enable_worker(output: str) -> None:
+    '''
+    Starts recording in a worker process, saving to output with {pid}
+    replaced by the process id
+    '''
+    enable(output.replace('{pid}', str(os.getpid())))
+
+
+def _save_output() -> None:
+    if _output:
+        save(_output)
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def span(name: str, **args) -> '_Span':
+    '''
+    Returns a context manager that records the time spent in it under name
+    '''
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(name: str) -> callable:
+    '''
+    Decorates a function so every call to it is recorded as a span under name
+    '''
+    def decorator(function) -> callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Span(name, dict()):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, amount=1) -> None:
+    '''
+    Adds an amount to the counter of the given name
+    '''
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def reset() -> None:
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def summary() -> dict:
+    '''
+    Returns the total seconds and calls of every span name with the counters
+    '''
+    totals = dict()
+    with _lock:
+        for name, _, duration, _, _ in _spans:
+            total = totals.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            total['seconds'] += duration
+            total['calls'] += 1
+        return {'spans': totals, 'counters': dict(_counters)}
+
+
+def to_chrome_trace() -> dict:
+    '''
+    Returns the recorded spans and counters in the Chrome trace event format
+    '''
+    pid = os.getpid()
+    with _lock:
+        events = [{'name': name, 'ph': 'X', 'ts': begin * 1e6, 'dur': duration * 1e6,
+                   'pid': pid, 'tid': tid, 'args': args}
+                  for name, begin, duration, tid, args in _spans]
+        end = max((begin + duration for _, begin, duration, _, _ in _spans), default=0.0)
+        events += [{'name': name, 'ph': 'C', 'ts': end * 1e6, 'pid': pid, 'args': {name: value}}
+                   for name, value in _counters.items()]
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def save(path: str) -> None:
+    '''
+    Writes the trace to a file, as a Chrome trace if the path ends in
+    .trace or .chrome.json and as a JSON summary otherwise
+    '''
+    import json
+    if path.endswith(('.trace', '.chrome.json')):
+        data = to_chrome_trace()
+    else:
+        data = summary()
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=2)
+
+
+if os.environ.get('WSVISION_TRACE'):
+    enable_worker(os.environ['WSVISION_TRACE'])
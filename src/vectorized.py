@@ -0,0 +1,87 @@
+'''
+The vectorized.py module implements an optional NumPy backend for the
+word search that checks every candidate start of the grid at once
+'''
+
+import numpy as np
+import search
+from search import FoundSearch
+
+
+class VectorizedSearcher(search.Searcher):
+    def __init__(self, contents: [[str]]) -> None:
+        super().__init__(contents)
+        # map every character in the grid to a uint8 code, 0 marks a missing cell
+        self._codes = dict()
+        height = len(contents)
+        width = max((len(row) for row in contents), default=0)
+        self._grid = np.zeros((height, width), dtype=np.uint8)
+        for r, row in enumerate(contents):
+            row_codes = []
+            for char in row:
+                if char not in self._codes:
+                    if len(self._codes) == 255:
+                        raise ValueError('Grid has more than 255 distinct characters')
+                    self._codes[char] = len(self._codes) + 1
+                row_codes.append(self._codes[char])
+            self._grid[r, :len(row_codes)] = row_codes
+
+    def search(self, word) -> ([FoundSearch] or None):
+        '''
+        Searches for a word in the grid and returns the
+        coordinates and direction of the found location
+        '''
+        if len(word) == 0:
+            return
+        return self._search_word(word)
+
+    def search_all(self, words: [str]) -> {str: [FoundSearch] or None}:
+        '''
+        Searches for every word in the word bank and returns a dictionary
+        of each word to its found locations, or None if it is not found
+        '''
+        return {word: self._search_word(word) for word in words}
+
+    def _search_word(self, word: str) -> ([FoundSearch] or None):
+        '''
+        Compares shifted views of the grid against each character of the
+        word to find every start cell in all directions at once
+        '''
+        codes = [self._codes.get(char) for char in word]
+        if len(codes) == 0 or None in codes:
+            return None
+        height, width = self._grid.shape
+        span = len(codes) - 1
+        # cells that have not matched yet, since only the first direction is kept
+        remaining = np.ones((height, width), dtype=bool)
+        found_rows, found_cols, found_directions = [], [], []
+        for index, (dx, dy) in enumerate(search._DIRECTIONS):
+            # range of start cells that keep the whole word inside the grid
+            r0, r1 = max(0, -dy * span), min(height, height - dy * span)
+            c0, c1 = max(0, -dx * span), min(width, width - dx * span)
+            if r0 >= r1 or c0 >= c1:
+                continue
+            match = remaining[r0:r1, c0:c1].copy()
+            for k, code in enumerate(codes):
+                match &= self._grid[r0 + k * dy:r1 + k * dy, c0 + k * dx:c1 + k * dx] == code
+            rows, cols = np.nonzero(match)
+            rows += r0
+            cols += c0
+            remaining[rows, cols] = False
+            found_rows.append(rows)
+            found_cols.append(cols)
+            found_directions.append(np.full(len(rows), index))
+        if len(found_rows) == 0:
+            return None
+        rows = np.concatenate(found_rows)
+        if len(rows) == 0:
+            return None
+        cols = np.concatenate(found_cols)
+        directions = np.concatenate(found_directions)
+        # report the hits in the same row-major order as the pure-Python search
+        order = np.lexsort((cols, rows))
+        finds = []
+        for i in order:
+            dx, dy = search._DIRECTIONS[directions[i]]
+            finds.append(FoundSearch(r=int(rows[i]), c=int(cols[i]), dx=dx, dy=dy))
+        return finds
@@ -0,0 +1,91 @@
+'''
+Checks every search engine against a brute force search on small seeded
+grids with rows of different lengths
+'''
+
+import os
+import random
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+import search
+import sharded
+
+_SEED = 7
+_LETTERS = 'ABAC'
+
+
+def _brute_force(grid: [[str]], word: str) -> ([search.FoundSearch] or None):
+    '''
+    Returns the first direction that spells the word from each cell of the grid
+    '''
+    finds = []
+    for r in range(len(grid)):
+        for c in range(len(grid[r])):
+            for dx, dy in search._DIRECTIONS:
+                cells = [(r + i * dy, c + i * dx) for i in range(len(word))]
+                if all(0 <= row < len(grid) and 0 <= col < len(grid[row]) and grid[row][col] == char
+                       for (row, col), char in zip(cells, word)):
+                    finds.append(search.FoundSearch(r=r, c=c, dx=dx, dy=dy))
+                    break
+    return finds if len(finds) > 0 else None
+
+
+def _puzzles(count: int, seed=_SEED) -> 'Generator':
+    rng = random.Random(seed)
+    for _ in range(count):
+        grid = [[rng.choice(_LETTERS) for _ in range(rng.randint(1, 8))] for _ in range(rng.randint(1, 8))]
+        words = list(dict.fromkeys(''.join(rng.choice('ABD') for _ in range(rng.randint(1, 5))) for _ in range(6)))
+        yield grid, words + [word for word in ('ABA', 'A', 'AA') if word not in words]
+
+
+def test_searcher_matches_brute_force():
+    for grid, words in _puzzles(300):
+        searcher = search.Searcher(grid)
+        answers = searcher.search_all(words)
+        for word in words:
+            expected = _brute_force(grid, word)
+            assert searcher.search(word) == expected
+            assert answers[word] == expected
+
+
+def test_vectorized_matches_brute_force():
+    vectorized = pytest.importorskip('vectorized')
+    for grid, words in _puzzles(300):
+        searcher = vectorized.VectorizedSearcher(grid)
+        answers = searcher.search_all(words)
+        for word in words:
+            expected = _brute_force(grid, word)
+            assert searcher.search(word) == expected
+            assert answers[word] == expected
+
+
+def test_sharded_matches_brute_force():
+    for grid, words in _puzzles(10):
+        answers = sharded.search_sharded(grid, words, workers=2, band_rows=2)
+        assert answers == {word: _brute_force(grid, word) for word in words}
+
+
+def test_stream_matches_brute_force(tmp_path):
+    path = tmp_path / 'grid.txt'
+    for grid, words in _puzzles(100):
+        path.write_text('\n'.join(''.join(row) for row in grid))
+        answers = {word: [] for word in words}
+        for word, found in search.stream_search(str(path), words):
+            answers[word].append(found)
+        assert answers == {word: _brute_force(grid, word) or [] for word in words}
+
+
+def test_research_matches_brute_force():
+    rng = random.Random(_SEED)
+    for grid, words in _puzzles(300):
+        edited = [row[:] for row in grid]
+        for _ in range(rng.randint(0, 3)):
+            row = edited[rng.randrange(len(edited))]
+            row[rng.randrange(len(row))] = rng.choice('ABC')
+        changed = search.changed_cells(grid, edited)
+        before = search.Searcher(grid)
+        after = search.Searcher(edited)
+        for word in words:
+            assert after.research(word, before.search(word), changed) == _brute_force(edited, word)
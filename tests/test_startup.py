@@ -0,0 +1,49 @@
+'''
+Checks the import time budget of the modules that are loaded when the
+solver or the interface starts, so heavy imports stay deferred
+'''
+
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import pytest
+
+_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+# cumulative import time budgets in seconds, the best of a few runs
+_SEARCH_BUDGET = 0.05
+_INTERFACE_BUDGET = 0.5
+# modules that are only imported once they are needed
+_DEFERRED = ['cv2', 'pytesseract', 'numpy', 'asyncio', 'multiprocessing', 'imaging', 'service', 'session']
+
+
+def _import(module: str, runs=3) -> (float, [str]):
+    '''
+    Imports a module in fresh interpreters and returns its best cumulative
+    import time along with the deferred modules it loaded
+    '''
+    code = f'import sys, {module}; print(" ".join(sorted(sys.modules)))'
+    best = None
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=_SOURCE,
+                                 capture_output=True, text=True, check=True)
+        # the report lists the cumulative time of each module in microseconds
+        match = re.search(rf'\|\s*(\d+)\s*\|\s*{re.escape(module)}\s*$', process.stderr, re.MULTILINE)
+        seconds = int(match.group(1)) / 1e6
+        best = seconds if best is None else min(best, seconds)
+    loaded = set(process.stdout.split())
+    return best, [name for name in _DEFERRED if name in loaded]
+
+
+def test_search_import_budget():
+    seconds, loaded = _import('search')
+    assert loaded == []
+    assert seconds <= _SEARCH_BUDGET
+
+
+@pytest.mark.skipif(importlib.util.find_spec('customtkinter') is None, reason='customtkinter is not installed')
+def test_interface_import_budget():
+    seconds, loaded = _import('interface')
+    assert loaded == []
+    assert seconds <= _INTERFACE_BUDGET